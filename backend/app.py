@@ -5,15 +5,12 @@ from flask import Flask, request, render_template, redirect, url_for, flash, jso
 # ✅ NEW: Required for streaming responses from Flask
 from flask import Response, stream_with_context
 from flask_cors import CORS
-import ollama
-import faiss
 import numpy as np
-import pickle
-from sentence_transformers import SentenceTransformer
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-import fitz  # PyMuPDF
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+import hashlib
 import time
 import json
 import datetime
@@ -21,12 +18,36 @@ from werkzeug.utils import secure_filename
 import base64
 import time
 from datetime import datetime
-from docx import Document
 import json
+import asyncio
+import threading
 import subprocess
+import logging
+from collections import namedtuple
 
-import markdown
 import re
+from chunk_store import ChunkStore, store_exists, migrate_pickle
+import index_generations
+from embedding_cache import EmbeddingCache
+from embedding_backends import embedding_settings, resolve_backend, model_id, load_model
+from lexical_index import LexicalIndex, retrieval_settings, reciprocal_rank_fusion
+from context_assembler import ContextAssembler
+from lru import LRUCache
+from query_embedder import QueryEmbedder
+from embed_batcher import EmbeddingBatcher
+from response_cache import ResponseCache, IN_PROGRESS
+from single_flight import SingleFlight
+from scheduler import OllamaScheduler, Overloaded, INTERACTIVE, BACKGROUND
+from model_residency import ModelResidency
+from semantic_cache import SemanticCache
+from stats_store import StatsStore, ollama_metrics, BUCKET_FORMATS
+from metrics import REGISTRY, Counter, Gauge, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from tracing import configure_logging, start_trace, log
+from streaming import flush_settings, wants_sse, text_stream, sse_stream, STREAM_HEADERS
+from streaming import text_stream_async, sse_stream_async, run_in_background, ASYNC_STREAM_KEY
+from lazy import Lazy, warm_up
+# Heavy dependencies (sentence_transformers, langchain, fitz, docx, markdown, ollama) are
+# imported where first used, so the app starts serving before they are loaded
 
 
 
@@ -34,11 +55,15 @@ import re
 
 
 # configurations
-executor = ThreadPoolExecutor(max_workers=3)  # You can adjust the number of workers as needed
+executor = ThreadPoolExecutor(max_workers=3)  # Background project step jobs; Ollama access is gated by the scheduler
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
-INDEX_PATH = os.path.join(APP_DIR, "vector_index.faiss")
-CHUNKS_PATH = os.path.join(APP_DIR, "chunks.pkl")
-STATS_FILE = "stats.json"
+# Index files inside an index generation directory (see index_generations.py)
+INDEX_FILE = "vector_index.faiss"
+LEGACY_CHUNKS_FILE = "chunks.pkl"  # Legacy pickle, migrated to the chunk store on load
+MANIFEST_FILE = "index_manifest.json"
+STATS_FILE = "stats.json"  # Legacy whole-file stats, migrated into the stats store
+STATS_PAGE_SIZE = 50
+MAX_STATS_PAGE_SIZE = 1000
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 PROJECTS_DIR = os.path.join(BASE_DIR, "projects")
 UPLOAD_FOLDER_FILES = os.path.join(BASE_DIR, "uploads", "files")
@@ -46,7 +71,7 @@ UPLOAD_FOLDER_RAG = os.path.join(BASE_DIR, "uploads", "rag")
 UPLOAD_FOLDER_IMAGES = os.path.join(BASE_DIR, "uploads", "images")
 ALLOWED_EXTENSIONS = {'pdf', 'jpg', 'jpeg', 'png', 'gif', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx'}
 MAX_FILE_SIZE = 25 * 1024 * 1024  # 25 MB
-CACHE_FILE = "query_cache.json"
+CACHE_FILE = "query_cache.json"  # Legacy whole-file cache, migrated into the response cache
 # Configuration file path
 CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "config.json")
 
@@ -81,12 +106,27 @@ def load_config():
     return {}
 
 
+_config_snapshot = {"mtime": None, "config": {}}
+
+def current_config():
+    """load_config(), re-read only when config.json changes. Cheap enough for the request path."""
+    try:
+        mtime = os.path.getmtime(CONFIG_FILE)
+    except OSError:
+        return {}
+    if mtime != _config_snapshot["mtime"]:
+        _config_snapshot.update(mtime=mtime, config=load_config())
+    return _config_snapshot["config"]
+
+
 def save_config(cfg):
     """Persist settings to config.json"""
     with open(CONFIG_FILE, "w") as f:
         json.dump(cfg, f, indent=2)
 
 
+configure_logging(load_config())
+
 # folder creation
 os.makedirs(UPLOAD_FOLDER_FILES, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER_RAG, exist_ok=True)
@@ -96,30 +136,53 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def load_cache():
-    if not os.path.exists(CACHE_FILE):
-        return {}
-
-    try:
-        with open(CACHE_FILE, "r") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, ValueError) as e:
-        print(f"⚠️ Failed to load cache — corrupted or empty file. Returning empty. Error: {e}")
-        return {}
-
-def save_cache(cache):
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f, indent=2)
-
+# Answers keyed by "prompt|model"; shared with other worker processes through SQLite
+response_cache = ResponseCache.from_config(current_config())
+response_cache.import_json(CACHE_FILE)
+# Identical in-flight /ask requests share one generation
+generations = SingleFlight()
+# Every Ollama call waits here for a per-model slot, interactive requests first
+scheduler = OllamaScheduler.from_config(current_config())
+# Which models Ollama keeps loaded: keep_alive per model, LRU unloading within a memory budget
+residency = ModelResidency.from_config(current_config(), lambda: scheduler.client,
+                                       is_busy=lambda model: scheduler.active(model) > 0)
+if current_config().get("model_residency", {}).get("preload", True):
+    threading.Thread(target=residency.preload, daemon=True, args=([
+        current_config().get("default_text_model"),
+        current_config().get("default_image_model")
+    ],)).start()
+
+
+def overloaded_response(error, body):
+    """The shed request's status (429 or 503) with a Retry-After hint."""
+    response = jsonify(body) if isinstance(body, dict) else Response(body, mimetype="text/plain")
+    response.status_code = error.status
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def load_index(directory=None):
+    directory = directory or index_generations.current_index_dir()
+    index_path = os.path.join(directory, INDEX_FILE)
+    legacy_chunks_path = os.path.join(directory, LEGACY_CHUNKS_FILE)
+    print(f"📂 Checking for {index_path} and the chunk store in {directory}...")
+    if not store_exists(directory) and os.path.exists(legacy_chunks_path):
+        try:
+            migrate_pickle(legacy_chunks_path, directory)
+        except Exception as e:
+            print(f"❌ Error migrating {legacy_chunks_path}: {e}")
 
-def load_index():
-    print(f"📂 Checking for {INDEX_PATH} and {CHUNKS_PATH}...")
-    if os.path.exists(INDEX_PATH) and os.path.exists(CHUNKS_PATH):
+    if os.path.exists(index_path) and store_exists(directory):
+        import faiss
+        from index_factory import index_settings, apply_search_params
         try:
-            index = faiss.read_index(INDEX_PATH)
-            with open(CHUNKS_PATH, "rb") as f:
-                chunks = pickle.load(f)
+            index = faiss.read_index(index_path)
+            # nprobe / efSearch are search-time knobs, so config changes apply without a rebuild
+            apply_search_params(index, index_settings(load_config()))
+            # Chunks stay on disk (mmapped); only the ones a query retrieves get decoded
+            chunks = ChunkStore(directory)
             print(f"✅ Loaded FAISS index with {index.ntotal} vectors and {len(chunks)} chunks.")
+            warn_on_embedding_mismatch(directory)
             return index, chunks
         except Exception as e:
             print(f"❌ Error loading FAISS index or chunks: {e}")
@@ -127,42 +190,284 @@ def load_index():
         print("❌ One or both files do not exist.")
     return None, []
 
+def load_lexical_index(directory):
+    """The generation's BM25 index, or None (older builds have none; dense retrieval still works)."""
+    try:
+        lexical = LexicalIndex.load(directory)
+    except Exception as e:
+        print(f"❌ Error loading BM25 index: {e}")
+        return None
+    if lexical is None:
+        print("⚠️ No BM25 index in this generation; retrieval is dense-only until the next build.")
+    else:
+        print(f"✅ Loaded BM25 index with {len(lexical.vocab)} terms.")
+    return lexical
 
-def load_stats():
-    if os.path.exists(STATS_FILE):
-        with open(STATS_FILE, "r") as f:
-            return json.load(f)
-    return []
+def warn_on_embedding_mismatch(directory):
+    """Queries must be embedded like the index was; say so if the backends differ."""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            indexed_with = json.load(f).get("model")
+    except (OSError, ValueError):
+        return
+    if indexed_with and indexed_with != model_id(EMBEDDING_BACKEND):
+        log.warning(f"⚠️ Index was embedded with {indexed_with} but queries use {model_id(EMBEDDING_BACKEND)}; "
+                    f"rebuild it with POST /rebuild-index?full=1")
+
+
+stats_store = StatsStore()
+stats_store.import_json(STATS_FILE)
+
+
+def paged_stats():
+    """Raw stat rows for ?limit=&offset=&order=asc|desc (newest first by default)."""
+    limit = min(max(request.args.get("limit", STATS_PAGE_SIZE, type=int), 1), MAX_STATS_PAGE_SIZE)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    newest_first = request.args.get("order", "desc") != "asc"
+    return {
+        "rows": stats_store.rows(limit, offset, newest_first=newest_first),
+        "total": stats_store.count(),
+        "limit": limit,
+        "offset": offset
+    }
 
 def save_stat(record):
-    stats = load_stats()
-
     # Prevent duplicates: only log if this prompt+model combo hasn't been logged
-    for row in stats:
-        if row["question"] == record["question"] and row["model"] == record["model"]:
-            print(f"⚠️ Stat already exists for model={record['model']} | question='{record['question']}'")
-            return  # Skip duplicate
+    if not stats_store.add(record):
+        log.debug("⚠️ Stat already exists for model=%s | question='%s'", record['model'], record['question'])
+        return  # Skip duplicate
+
+    log.debug("📝 Logged stat: model=%s | time=%s ms | source=%s | question='%s'",
+              record['model'], record['response_time_ms'], record.get('source'), record['question'])
+
+
+# Prometheus metrics, served at /metrics
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Time per pipeline stage (extraction, splitting, embedding, retrieval, search).", ["stage"])
+TTFT_SECONDS = REGISTRY.histogram(
+    "rag_time_to_first_token_seconds", "Request start to first generated token.", ["model", "source"])
+GENERATION_SECONDS = REGISTRY.histogram(
+    "rag_generation_seconds", "Request start to last generated token.", ["model", "source"])
+GENERATED_TOKENS = REGISTRY.counter("rag_generated_tokens_total", "Tokens generated by Ollama.", ["model", "source"])
+REQUESTS = REGISTRY.counter("rag_requests_total", "Requests by endpoint and outcome.", ["endpoint", "outcome"])
+OLLAMA_STREAMS = REGISTRY.gauge("rag_ollama_streams_in_flight", "Ollama generations currently streaming.", ["source"])
+RUN_STEP_JOBS = REGISTRY.gauge("rag_run_step_jobs_in_flight", "Background project step jobs currently running.")
+REBUILDS = REGISTRY.counter("rag_index_rebuilds_total", "Background index rebuilds by result.", ["result"])
+REBUILD_SECONDS = REGISTRY.histogram(
+    "rag_index_rebuild_seconds", "Duration of background index rebuilds.",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+
+
+def count_outcome(trace, endpoint, outcome):
+    REQUESTS.inc(endpoint=endpoint, outcome=outcome)
+    trace.set(outcome=outcome)
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+def observe_generation(model, source, timer, ttft_ms, metrics):
+    timer.set(residency=residency.record(model, ttft_ms, metrics))
+    if ttft_ms is not None:
+        TTFT_SECONDS.observe(ttft_ms / 1000, model=model, source=source)
+    GENERATION_SECONDS.observe(timer.elapsed_ms() / 1000, model=model, source=source)
+    if metrics.get("eval_count"):
+        GENERATED_TOKENS.inc(metrics["eval_count"], model=model, source=source)
+
+
+@REGISTRY.collector
+def collect_state_metrics():
+    """Values already tracked elsewhere, read at scrape time only."""
+    cache_requests = Counter("rag_cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"])
+    caches = {
+        "response": response_cache,
+        "semantic_response": semantic_cache,
+        "query_embedding": query_embedder.cache,
+        "chunk_embedding": embedding_cache,
+        "dynamic_document": dynamic_doc_cache
+    }
+    for name, cache in caches.items():
+        if cache is not None:
+            cache_requests.inc(cache.hits, cache=name, result="hit")
+            cache_requests.inc(cache.misses, cache=name, result="miss")
+
+    live = live_index  # Not loaded yet counts as empty; scraping shouldn't trigger the load
+    index_vectors = Gauge("rag_index_vectors", "Vectors in the live FAISS index.")
+    index_vectors.set(live.index.ntotal if live and live.index is not None else 0)
+    index_chunks = Gauge("rag_index_chunks", "Chunks in the live chunk store.")
+    index_chunks.set(len(live.chunks) if live and live.chunks else 0)
+    shared_generations = Gauge("rag_shared_generations_in_flight", "Distinct /ask generations currently running.")
+    shared_generations.set(generations.stats()["in_flight"])
+    rebuild_running = Gauge("rag_index_rebuild_running", "1 while a background index rebuild runs.")
+    rebuild_running.set(1 if rebuild_state.get("state") == "running" else 0)
+    components_ready = Gauge("rag_component_ready", "1 once a lazily loaded component is ready.", ["component"])
+    for component in COMPONENTS:
+        components_ready.set(1 if component.ready else 0, component=component.name)
+    resident_models = Gauge("rag_model_resident_megabytes", "Memory of each model Ollama has loaded.", ["model"])
+    for entry in residency.stats()["resident"]:
+        resident_models.set(entry["size_mb"], model=entry["model"])
+    ollama_active = Gauge("rag_ollama_requests_active", "Ollama requests holding a scheduler slot.", ["model"])
+    ollama_queued = Gauge("rag_ollama_queue_depth", "Ollama requests waiting for a scheduler slot.", ["model"])
+    for model, state in scheduler.stats()["models"].items():
+        ollama_active.set(state["active"], model=model)
+        ollama_queued.set(state["queued"], model=model)
+    return [cache_requests, index_vectors, index_chunks, shared_generations, rebuild_running, components_ready,
+            resident_models, ollama_active, ollama_queued]
+
+
+# The live index is swapped as one tuple, so a request that grabbed it keeps a
+# consistent index + chunks (+ BM25) set even if a rebuild activates a new generation mid-flight
+LiveIndex = namedtuple("LiveIndex", ["generation", "index", "chunks", "lexical"])
+live_index = None  # Loaded on first use (or by warm-up) through current_index()
+
+
+def load_live_index():
+    global live_index
+    directory = index_generations.current_index_dir()
+    loaded = LiveIndex(index_generations.current_generation(), *load_index(directory), load_lexical_index(directory))
+
+    if loaded.index is None:
+        print("⚠️ vector_index is NOT loaded.")
+    else:
+        print(f"✅ vector_index loaded successfully. Index type: {type(loaded.index)} | generation: {loaded.generation}")
+
+    if not loaded.chunks:
+        print("⚠️ chunks are empty or not loaded.")
+    else:
+        print(f"✅ chunks loaded successfully. Total chunks: {len(loaded.chunks)}")
+    if live_index is None:  # activate_generation() may have got there first
+        live_index = loaded
+    return live_index
+
+index_loader = Lazy("vector_index", load_live_index)
+
+
+def current_index():
+    """The live index, loading the current generation on first use."""
+    return live_index or index_loader.get()
+
+
+def activate_generation(name):
+    """Load an index generation and atomically make it the one new requests search."""
+    global live_index
+    directory = index_generations.generation_dir(name)
+    index, chunks = load_index(directory)
+    if index is None:
+        raise RuntimeError(f"Index generation {name} could not be loaded")
+    lexical = load_lexical_index(directory)
+    index_generations.activate(name)
+    live_index = LiveIndex(name, index, chunks, lexical)
+    if semantic_cache is not None:
+        semantic_cache.clear()  # Answers were grounded in the old corpus
+    print(f"🔀 Now serving index generation {name} ({index.ntotal} vectors).")
+
+# fp32, int8 or onnx (embedding.backend in config.json); index builds use the same one
+EMBEDDING_SETTINGS = embedding_settings(load_config())
+EMBEDDING_BACKEND = resolve_backend(EMBEDDING_SETTINGS)
+
+def load_embedder():
+    model = load_model(EMBEDDING_BACKEND, EMBEDDING_SETTINGS)
+    model.encode(["warm-up"])  # The first encode initialises the tokenizer and kernels
+    return model
+
+embedder = Lazy("embedder", load_embedder)
+# Shared with prepare_data.py, so chunks embedded at index time are free here and vice versa
+# (vectors are keyed by backend too, as each backend's vectors differ slightly)
+embedding_cache = EmbeddingCache.from_config(load_config(), model_id(EMBEDDING_BACKEND))
+
 
-    stats.append(record)
-    with open(STATS_FILE, "w") as f:
-        json.dump(stats, f, indent=2)
+# The model is shared by the query batcher's worker and embed_chunks(); PyTorch models are not
+# safe to call from several threads at once (index rebuilds run in their own process)
+encode_lock = threading.Lock()
 
-    print(f"📝 Logged stat: model={record['model']} | time={record['response_time_ms']} ms | source={record.get('source')} | question='{record['question']}'")
+def encode(texts):
+    model = embedder.get()
+    with encode_lock:
+        return model.encode(texts)
 
+# Concurrent prompt misses are encoded together in one model call
+query_batcher = EmbeddingBatcher.from_config(load_config(), encode)
+# Prompt embeddings, reused across requests and across retrieval stages within one
+query_embedder = QueryEmbedder(query_batcher.encode if query_batcher else encode,
+                               load_config().get("query_embedding_cache_size", 1024))
 
-vector_index, chunks = load_index()
 
-if vector_index is None:
-    print("⚠️ vector_index is NOT loaded.")
-else:
-    print(f"✅ vector_index loaded successfully. Index type: {type(vector_index)}")
+# Optional: reuse answers to reworded prompts (per model, per index generation)
+semantic_cache = SemanticCache.from_config(load_config())
 
-if not chunks:
-    print("⚠️ chunks are empty or not loaded.")
-else:
-    print(f"✅ chunks loaded successfully. Total chunks: {len(chunks)}")
 
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+def embed_chunks(texts):
+    """Embed document chunks through the persistent embedding cache (when enabled)."""
+    if embedding_cache is None:
+        return encode(texts)
+    return embedding_cache.encode(texts, encode)
+
+
+# Files attached to /ask: chunks + embeddings per content hash, so follow-up questions
+# about the same document only need the prompt embedded
+DynamicDocument = namedtuple("DynamicDocument", ["chunks", "embeddings", "sq_norms"])
+dynamic_doc_cache = LRUCache(load_config().get("dynamic_doc_cache_size", 32))
+
+
+def load_text_splitter():
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
+
+text_splitter = Lazy("text_splitter", load_text_splitter)
+
+# Built in this order by warm-up; /readyz reports ready once all of them are
+COMPONENTS = [index_loader, embedder, text_splitter]
+
+
+def warm_up_enabled(config):
+    """startup.warm_up in config.json; RAG_WARM_UP=0/1 overrides."""
+    setting = os.environ.get("RAG_WARM_UP")
+    if setting is not None:
+        return setting.lower() not in ("0", "false", "no")
+    return config.get("startup", {}).get("warm_up", True)
+
+warm_up_thread = warm_up(COMPONENTS) if warm_up_enabled(current_config()) else None
+
+
+def load_dynamic_document(file, timer):
+    """Save, extract, split and embed an attached file once per distinct content."""
+    data = file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    filename = secure_filename(file.filename)
+    uploaded_path = os.path.join(UPLOAD_FOLDER_RAG, filename)
+
+    doc = dynamic_doc_cache.get(digest)
+    if doc is not None:
+        log.debug("⚡ Reusing cached chunks for %s (%d chunks).", filename, len(doc.chunks))
+        if not os.path.exists(uploaded_path):
+            with open(uploaded_path, "wb") as f:
+                f.write(data)
+        return doc
+
+    with timer.stage("extraction"):
+        with open(uploaded_path, "wb") as f:
+            f.write(data)
+        uploaded_text = extract_text_from_file(uploaded_path)
+    with timer.stage("splitting"):
+        chunks = text_splitter.get().split_text(uploaded_text) if uploaded_text else []
+    log.debug("🟡 Extracted %d chunks from uploaded file.", len(chunks))
+
+    with timer.stage("embedding"):
+        embeddings = np.asarray(embed_chunks(chunks), dtype=np.float32) if chunks else np.empty((0, 0), dtype=np.float32)
+    doc = DynamicDocument(chunks, embeddings, np.einsum("ij,ij->i", embeddings, embeddings))
+    dynamic_doc_cache.put(digest, doc)
+    return doc
+
+
+def top_k_nearest(doc, query_vector, k):
+    """Indices of the k chunks closest (L2) to query_vector, nearest first."""
+    n = len(doc.chunks)
+    if n == 0:
+        return []
+    # ||e - q||^2 = ||e||^2 - 2 e.q + ||q||^2, and the last term doesn't change the ranking
+    scores = doc.sq_norms - 2 * (doc.embeddings @ np.asarray(query_vector, dtype=np.float32))
+    k = min(k, n)
+    top = np.argpartition(scores, k - 1)[:k]
+    return top[np.argsort(scores[top])]
 
 def split_text(text, chunk_size=500, overlap=100):
     words = text.split()
@@ -179,10 +484,12 @@ def extract_text_from_file(path):
 
     try:
         if ext == "pdf":
+            import fitz  # PyMuPDF
             with fitz.open(path) as doc:
                 for page in doc:
                     text += page.get_text()
         elif ext == "docx":
+            from docx import Document
             doc = Document(path)
             text = "\n".join([para.text for para in doc.paragraphs])
         elif ext == "txt":
@@ -586,24 +893,66 @@ def delete_file():
 @app.route("/ask", methods=["POST"])
 def ask():
     """Handles model queries with caching and automatic streaming."""
-
+    trace = start_trace("ask", request.headers, current_config().get("tracing", {}), observe_stage)
+    with trace.profiled():
+        response = answer_question(trace)
+    if not trace.handed_off:
+        trace.finish()
+    response.headers["X-Request-ID"] = trace.request_id
+    return response
+
+
+def retrieve(live, prompt, query_vector, trace):
+    """Chunk ids for the prompt's RAG context, best first, per retrieval.mode in config.json:
+
+    dense    FAISS only
+    lexical  BM25 only; the prompt is never embedded
+    hybrid   both, merged by reciprocal-rank fusion
+
+    Generations without a BM25 index fall back to dense.
+    """
+    settings = retrieval_settings(current_config())
+    mode = settings["mode"] if live.lexical is not None else "dense"
+    trace.set(retrieval=mode)
+    top_k = settings["top_k"]
+    depth = settings["candidates"] if mode == "hybrid" else top_k
+    rankings = []
+    if mode != "lexical":
+        if query_vector is None:
+            with trace.stage("embedding"):
+                query_vector = query_embedder.encode(prompt)
+        with trace.stage("search"):
+            _, indices = live.index.search(query_vector[np.newaxis, :], k=depth)
+        # Index ids map into the chunk store; -1 means no hit
+        rankings.append([int(i) for i in indices[0] if i != -1])
+    if mode != "dense":
+        with trace.stage("lexical"):
+            _, ids = live.lexical.search(prompt, depth, k1=settings["bm25_k1"], b=settings["bm25_b"])
+        rankings.append(ids.tolist())
+    if len(rankings) == 1:
+        return rankings[0][:top_k]
+    return reciprocal_rank_fusion(rankings, settings["rrf_k"])[:top_k]
+
+
+def answer_question(trace):
     file = request.files.get('file')
-    
-    uploaded_text = ""
+
+    dynamic_doc = None
     dynamic_chunks = []
-    dynamic_context = ""
+    query_vector = None  # Encoded at most once, on first use
 
     prompt = request.form.get('prompt', '').strip()
     model = request.form.get('models', '').strip()
 
     # 🐛 Debug logs for input validation
-    print(f"🟢 Model received: {repr(model)}")
-    print(f"🟢 Prompt received: {repr(prompt)}")
+    trace.log.debug("🟢 Model received: %r", model)
+    trace.log.debug("🟢 Prompt received: %r", prompt)
+    trace.set(model=model)
 
 
     # 🚫 Validate prompt and model input
     if not model:
-        print("❌ No model selected.")
+        trace.log.info("❌ No model selected.")
         return jsonify({
             "model": "",
             "answer": "[Error: No model selected.]",
@@ -611,7 +960,7 @@ def ask():
         })
 
     if not prompt:
-        print("❌ Prompt is empty.")
+        trace.log.info("❌ Prompt is empty.")
         return jsonify({
             "model": model,
             "answer": "[Error: Prompt cannot be empty.]",
@@ -619,87 +968,123 @@ def ask():
         })
 
 
+    # 🧠 Save, extract, split and embed the uploaded file (cached by content hash)
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        uploaded_path = os.path.join(UPLOAD_FOLDER_RAG, filename)
-        file.save(uploaded_path)
+        try:
+            dynamic_doc = load_dynamic_document(file, trace)
+        except Exception as e:
+            trace.log.error(f"❌ Error embedding uploaded file: {e}")
 
-    # 🧠 Extract + split uploaded file content
-    uploaded_path = None
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        uploaded_path = os.path.join(UPLOAD_FOLDER_RAG, filename)
-        file.save(uploaded_path)
-
-    # 🧠 Extract + split uploaded file content only if uploaded_path exists
-    if uploaded_path:
-        uploaded_text = extract_text_from_file(uploaded_path)    
-        if uploaded_text:
-            from langchain.text_splitter import RecursiveCharacterTextSplitter
-            splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-            dynamic_chunks = splitter.split_text(uploaded_text)
-            print(f"🟡 Extracted {len(dynamic_chunks)} chunks from uploaded file.")
-
-    # 🧠 Embed and select top 10 chunks
-    if dynamic_chunks:
+    # 🧠 Select top 10 chunks
+    if dynamic_doc and dynamic_doc.chunks:
         try:
-            query_embedding = embedder.encode([prompt])
-            chunk_embeddings = embedder.encode(dynamic_chunks)
-            distances = np.linalg.norm(chunk_embeddings - query_embedding, axis=1)
-            top_indices = distances.argsort()[:10]
-            dynamic_context = "\n".join([dynamic_chunks[i] for i in top_indices])
-            print(f"📌 Selected top {len(top_indices)} relevant chunks for dynamic RAG context.")
-            print(f"🆕 Dynamic context: {dynamic_context[:500]}")
+            with trace.stage("embedding"):
+                query_vector = query_embedder.encode(prompt)
+            with trace.stage("retrieval"):
+                top_indices = top_k_nearest(dynamic_doc, query_vector, 10)
+            dynamic_chunks = [dynamic_doc.chunks[i] for i in top_indices]
+            trace.log.debug("📌 Selected top %d relevant chunks for dynamic RAG context.", len(top_indices))
+            trace.log.debug("🆕 Dynamic context: %s", "\n".join(dynamic_chunks)[:500])
 
         except Exception as e:
-            print(f"❌ Error embedding uploaded file: {e}")
+            trace.log.error(f"❌ Error embedding uploaded file: {e}")
 
 
 
-    print("\n🟡 /ask called")
-    print("🟡 Prompt:", prompt)
-    print("🟡 Model:", model)
+    trace.log.debug("🟡 /ask called with model %s: %s", model, prompt)
 
     key = f"{prompt}|{model}"
-    cache = load_cache()
+    live = current_index()
+    use_cache = current_config().get("enable_cache", True)
+    cached = response_cache.get(key) if use_cache else None
+    # Answers to attached documents depend on the file, so only plain questions match semantically
+    use_semantic_cache = use_cache and semantic_cache is not None and dynamic_doc is None
 
     # ✅ Return immediately if response is cached
-    if key in cache and cache[key] != "IN_PROGRESS":
-        print("⚡ Cache hit")
+    if cached is not None and cached != IN_PROGRESS:
+        trace.log.debug("⚡ Cache hit")
+        count_outcome(trace, "ask", "cache_hit")
         return jsonify({
             "model": model,
-            "answer": cache[key],
+            "answer": cached,
+            "time_ms": 0
+        })
+
+    # ✅ Or if a close enough rewording of it was answered from the same index generation
+    if cached is None and use_semantic_cache:
+        if query_vector is None:
+            with trace.stage("embedding"):
+                query_vector = query_embedder.encode(prompt)
+        with trace.stage("retrieval"):
+            match = semantic_cache.lookup(model, query_vector, live.generation)
+        if match:
+            similar_key, similarity = match
+            answer = response_cache.get(similar_key)
+            if answer is not None and answer != IN_PROGRESS:
+                trace.log.debug("⚡ Semantic cache hit (similarity %.3f)", similarity)
+                count_outcome(trace, "ask", "semantic_cache_hit")
+                return jsonify({
+                    "model": model,
+                    "answer": answer,
+                    "time_ms": 0
+                })
+            semantic_cache.discard(model, similar_key)  # Its answer expired
+
+    # ✅ If this process is already generating it, stream along (replaying what was sent so far)
+    flight, leader = generations.join(key)
+    if not leader:
+        trace.log.debug("🔗 Joining in-flight generation")
+        count_outcome(trace, "ask", "joined")
+        return flight_response(flight)
+
+    # ✅ Turn the request away now if the model's queue is already full
+    try:
+        scheduler.check(model, INTERACTIVE)
+    except Overloaded as e:
+        trace.log.info("🚦 Shed: %s", e)
+        count_outcome(trace, "ask", "shed")
+        generations.finish(key, flight, error=str(e))
+        return overloaded_response(e, {
+            "model": model,
+            "answer": f"[Error: {e}]",
             "time_ms": 0
         })
 
-    # ✅ If response is in progress, notify frontend (for polling)
-    if cache.get(key) == "IN_PROGRESS":
-        print("⏳ Already processing")
+    # ✅ If another worker process is generating it, notify frontend (for polling).
+    # claim() marks it in progress atomically, so only one process generates it.
+    if cached == IN_PROGRESS or (use_cache and not response_cache.claim(key)):
+        trace.log.debug("⏳ Already processing")
+        count_outcome(trace, "ask", "busy")
+        generations.finish(key, flight, error="Another worker is generating this answer.")
         return jsonify({
             "model": model,
             "answer": "Loading...",
             "time_ms": 0
         })
 
-    # ✅ Otherwise, mark as in progress
-    cache[key] = "IN_PROGRESS"
-    save_cache(cache)
-
     # ✅ Build RAG context (if index is available)
-    context = ""
-    if vector_index and chunks:
+    rankings = [dynamic_chunks]
+    if live.index and live.chunks:
         try:
-            query_embedding = embedder.encode([prompt])
-            scores, indices = vector_index.search(np.array(query_embedding), k=3)
-            prebuilt_context = "\n".join([chunks[i] for i in indices[0]])
-            print(f"🧩 Prebuilt context: {prebuilt_context[:500]}")
-            context = dynamic_context + "\n" + prebuilt_context if dynamic_context else prebuilt_context
+            chunk_ids = retrieve(live, prompt, query_vector, trace)
+            prebuilt_chunks = [live.chunks[i] for i in chunk_ids]
+            trace.log.debug("🧩 Prebuilt context: %s", "\n".join(prebuilt_chunks)[:500])
+            rankings.append(prebuilt_chunks)
         except Exception as e:
-            print(f"❌ Error retrieving from vector index: {e}")
-            context = dynamic_context  # Fallback
+            trace.log.error(f"❌ Error retrieving from vector index: {e}")  # Fallback: dynamic context only
     else:
-        print("⚠️ vector_index or chunks missing; using only dynamic context.")
-        context = dynamic_context
+        trace.log.debug("⚠️ vector_index or chunks missing; using only dynamic context.")
+
+    # De-duplicated, diversified and packed into the model's token budget
+    with trace.stage("assembly"):
+        assembled = ContextAssembler.from_config(current_config()).assemble(rankings, model)
+    context = assembled.text
+    context_stats = {
+        "context_tokens": assembled.tokens,
+        "context_tokens_saved": max(assembled.naive_tokens - assembled.tokens, 0)
+    }
+    trace.set(context_chunks=assembled.chunks, duplicate_chunks=assembled.duplicates,
+              over_budget_chunks=assembled.over_budget, **context_stats)
 
 
     messages = [
@@ -713,67 +1098,156 @@ def ask():
         }
     ]
     # More precise logging
+    trace.set(context_chars=len(context))
     if not context.strip():
-        print("🧠 Final context sent to model is EMPTY.")
+        trace.log.debug("🧠 Final context sent to model is EMPTY.")
     else:
-        print(f"🧠 Final context sent to model (len={len(context)}):")
-        print(context[:1000] + ("..." if len(context) > 1000 else ""))
+        trace.log.debug("🧠 Final context sent to model (len=%d):\n%s", len(context),
+                        context[:1000] + ("..." if len(context) > 1000 else ""))
 
 
 
 
-    
-    def stream_response():
-        try:
-            print("📨 Final messages to model:")
-            for m in messages:
-                print(f"- {m['role']}: {m['content'][:500]}" + ("..." if len(m['content']) > 500 else ""))
-
-            response = ollama.chat(
-                model=model,
-                messages=messages,
-                stream=True
-            )
-
-            collected = ""
-            for chunk in response:
-                piece = chunk.get("message", {}).get("content", "")
-                if not piece:
-                    continue  # Skip empty chunks
-            
-                collected += piece
-
-                # 🪵 Debug: Print to server logs so we can verify backend is streaming
-                print(f"📤 Streaming chunk: {repr(piece)}")
-
-                # ✅ Yield each chunk (plus optional flush trick)
-                yield piece
-                time.sleep(0.01)  # 💤 Optional: Tiny delay to flush buffer
-
-            # Save full response after stream ends
-            # Convert to HTML after full stream
-            html_response = markdown.markdown(collected)
-            cache[key] = html_response
-            save_cache(cache)
-            print("✅ Streaming complete. Final response:")
 
-            save_stat({
-                "question": prompt,
-                "model": model,
-                "response_time_ms": 0,
-                "timestamp": datetime.now().isoformat(),
-                "source": "Text Analysis"
-            })
+    collected = []
+    ttft_ms = None
+    metrics = {}
 
+    def log_messages():
+        trace.log.debug("📨 Final messages to model:")
+        for m in messages:
+            trace.log.debug("- %s: %s", m['role'], m['content'][:500] + ("..." if len(m['content']) > 500 else ""))
+
+    def on_chunk(chunk):
+        nonlocal ttft_ms, metrics
+        if chunk.get("done"):
+            metrics = ollama_metrics(chunk)
+        piece = chunk.get("message", {}).get("content", "")
+        if not piece:
+            return  # Skip empty chunks
+        if ttft_ms is None:
+            ttft_ms = trace.elapsed_ms()
+
+        collected.append(piece)
+
+        # 🪵 Debug: log each chunk so we can verify backend is streaming
+        trace.log.debug("📤 Streaming chunk: %r", piece)
+
+        # ✅ Fan each chunk out to every subscriber
+        flight.publish(piece)
+
+    def complete():
+        import markdown
+
+        # Save full response after stream ends
+        # Convert to HTML after full stream
+        html_response = markdown.markdown("".join(collected))
+        if use_cache:
+            response_cache.set(key, html_response)
+            if use_semantic_cache:
+                semantic_cache.add(model, query_embedder.encode(prompt), key, live.generation)
+        else:
+            # Not cached, but the page fetches the rendered answer from /cache right after streaming
+            response_cache.set(key, html_response, ttl_seconds=60, persist=False)
+        trace.log.debug("✅ Streaming complete to %d subscriber(s).", flight.subscribers)
+        record = {
+            "question": prompt,
+            "model": model,
+            "response_time_ms": round(trace.elapsed_ms(), 2),
+            "ttft_ms": round(ttft_ms, 2) if ttft_ms is not None else None,
+            "timestamp": datetime.now().isoformat(),
+            "source": "Text Analysis",
+            **trace.record(),
+            **context_stats,
+            **metrics
+        }
+        # The summary is the final "stats" event of SSE streams
+        summary = {name: value for name, value in record.items() if name != "question" and value is not None}
+        generations.finish(key, flight, summary={"request_id": trace.request_id, **summary})
+        count_outcome(trace, "ask", "generated")
+        observe_generation(model, "Text Analysis", trace, ttft_ms, metrics)
+        save_stat(record)
+
+    def fail(e):
+        trace.log.error(f"❌ Streaming error: {e}")
+        if use_cache:
+            response_cache.delete(key)
+        generations.finish(key, flight, error=str(e) or type(e).__name__)
+        count_outcome(trace, "ask", "error")
+
+    def stream_answer():
+        OLLAMA_STREAMS.inc(source="Text Analysis")
+        try:
+            log_messages()
+            with trace.stage("queue"):
+                slot = scheduler.acquire(model, INTERACTIVE)
+            with slot:
+                residency.prepare(model)
+                for chunk in scheduler.client.chat(model=model, messages=messages, stream=True,
+                                                   keep_alive=residency.keep_alive(model)):
+                    on_chunk(chunk)
+            complete()
         except Exception as e:
-            print(f"❌ Streaming error: {e}")
-            cache.pop(key, None)
-            save_cache(cache)
-            yield f"\n[Error: {str(e)}]"
-
+            fail(e)
+        finally:
+            OLLAMA_STREAMS.dec(source="Text Analysis")
+
+    def generate():
+        """Runs in its own thread so the answer completes (and is cached) even if clients disconnect."""
+        with trace.profiled():
+            stream_answer()
+        trace.finish()
+
+    async def generate_async(client):
+        """generate() as a task on the ASGI server's event loop, streaming from Ollama's AsyncClient."""
+        OLLAMA_STREAMS.inc(source="Text Analysis")
+        try:
+            log_messages()
+            with trace.stage("queue"):
+                slot = await scheduler.acquire_async(model, INTERACTIVE)
+            with slot:
+                await asyncio.to_thread(residency.prepare, model)
+                async for chunk in await client.chat(model=model, messages=messages, stream=True,
+                                                     keep_alive=residency.keep_alive(model)):
+                    on_chunk(chunk)
+            await asyncio.to_thread(complete)  # Markdown and SQLite writes stay off the loop
+        except (Exception, asyncio.CancelledError) as e:
+            fail(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            OLLAMA_STREAMS.dec(source="Text Analysis")
+            trace.finish()
+
+    trace.hand_off()
+    if request.environ.get(ASYNC_STREAM_KEY):
+        return flight_response(flight, generate_async)
+    threading.Thread(target=generate, daemon=True).start()
 
     # ✅ Return streamed response
-    return Response(stream_with_context(stream_response()), content_type="text/plain")
+    return flight_response(flight)
+
+
+def flight_response(flight, produce_async=None):
+    """Stream a flight as plain text, or as Server-Sent Events when the client asks for them.
+
+    Under asgi.py the body is async_body(client), which first starts produce_async(client)
+    (the leader's generation) as a background task.
+    """
+    flush = flush_settings(current_config())
+    sse = wants_sse(request)
+    content_type = "text/event-stream" if sse else "text/plain"
+    if request.environ.get(ASYNC_STREAM_KEY):
+        def async_body(client):
+            if produce_async is not None:
+                run_in_background(produce_async(client))
+            return (sse_stream_async if sse else text_stream_async)(flight, **flush)
+
+        response = Response(content_type=content_type, headers=STREAM_HEADERS)
+        response.async_body = async_body
+        return response
+    body = sse_stream(flight, **flush) if sse else text_stream(flight, **flush)
+    return Response(stream_with_context(body), content_type=content_type, headers=STREAM_HEADERS)
 
 def try_load_output(slug, step):
     path = os.path.join("projects", slug, "outputs", f"{step}.md")
@@ -786,6 +1260,7 @@ from flask import Response, stream_with_context
 
 @app.route("/analyze-image", methods=["POST"])
 def analyze_image():
+    trace = start_trace("analyze_image", request.headers, current_config().get("tracing", {}), observe_stage)
     try:
         if 'image' not in request.files:
             return "❌ No image uploaded", 400
@@ -807,34 +1282,105 @@ def analyze_image():
             encoded_image = base64.b64encode(img_file.read()).decode('utf-8')
 
         model = request.form.get("image_model", "bakllava")
-        print("🟡 Streaming image analysis using model:", model)
-
-        def stream_chunks():
-            response = ollama.generate(
-                model=model,
-                prompt=prompt,
-                images=[encoded_image],
-                stream=True
-            )
-
-            collected = ""
-            for chunk in response:
-                piece = chunk.get("response", "")
-                collected += piece
-                yield piece
+        trace.log.debug("🟡 Streaming image analysis using model: %s", model)
+        trace.set(model=model)
+        try:
+            scheduler.check(model, INTERACTIVE)
+        except Overloaded as e:
+            count_outcome(trace, "analyze_image", "shed")
+            trace.finish()
+            return overloaded_response(e, f"❌ {e}")
+
+        collected = []
+        ttft_ms = None
+        metrics = {}
+
+        def on_chunk(chunk):
+            nonlocal ttft_ms, metrics
+            if chunk.get("done"):
+                metrics = ollama_metrics(chunk)
+            piece = chunk.get("response", "")
+            if piece and ttft_ms is None:
+                ttft_ms = trace.elapsed_ms()
+            collected.append(piece)
+            return piece
+
+        def record():
+            observe_generation(model, "Image Analysis", trace, ttft_ms, metrics)
 
             save_stat({
                 "question": prompt,
                 "model": model,
-                "response_time_ms": 0,
+                "response_time_ms": round(trace.elapsed_ms(), 2),
+                "ttft_ms": round(ttft_ms, 2) if ttft_ms is not None else None,
                 "timestamp": datetime.now().isoformat(),
-                "source": "Image Analysis"
+                "source": "Image Analysis",
+                **trace.record(),
+                **metrics
             })
 
-        return Response(stream_chunks(), mimetype='text/plain')
+        def stream_chunks():
+            OLLAMA_STREAMS.inc(source="Image Analysis")
+            try:
+                with trace.profiled():
+                    with trace.stage("queue"):
+                        slot = scheduler.acquire(model, INTERACTIVE)
+                    with slot:
+                        residency.prepare(model)
+                        response = scheduler.client.generate(
+                            model=model,
+                            prompt=prompt,
+                            images=[encoded_image],
+                            stream=True,
+                            keep_alive=residency.keep_alive(model)
+                        )
+                        for chunk in response:
+                            yield on_chunk(chunk)
+                count_outcome(trace, "analyze_image", "generated")
+            except Exception:
+                count_outcome(trace, "analyze_image", "error")
+                raise
+            finally:
+                # Also on a client disconnect, which closes the generator at its current yield
+                OLLAMA_STREAMS.dec(source="Image Analysis")
+                record()
+                trace.finish()
+
+        async def stream_chunks_async(client):
+            OLLAMA_STREAMS.inc(source="Image Analysis")
+            try:
+                with trace.stage("queue"):
+                    slot = await scheduler.acquire_async(model, INTERACTIVE)
+                with slot:
+                    await asyncio.to_thread(residency.prepare, model)
+                    response = await client.generate(
+                        model=model,
+                        prompt=prompt,
+                        images=[encoded_image],
+                        stream=True,
+                        keep_alive=residency.keep_alive(model)
+                    )
+                    async for chunk in response:
+                        yield on_chunk(chunk)
+                count_outcome(trace, "analyze_image", "generated")
+            except Exception:
+                count_outcome(trace, "analyze_image", "error")
+                raise
+            finally:
+                OLLAMA_STREAMS.dec(source="Image Analysis")
+                await asyncio.to_thread(record)
+                trace.finish()
+
+        if request.environ.get(ASYNC_STREAM_KEY):
+            response = Response(mimetype='text/plain')
+            response.async_body = stream_chunks_async
+        else:
+            response = Response(stream_chunks(), mimetype='text/plain')
+        response.headers["X-Request-ID"] = trace.request_id
+        return response
 
     except Exception as e:
-        print(f"❌ Error in /analyze-image: {e}")
+        trace.log.error(f"❌ Error in /analyze-image: {e}")
         return f"❌ Error: {e}", 500
 
 @app.route("/image", methods=["GET"])
@@ -850,30 +1396,142 @@ def image_page():
 
 @app.route("/stats")
 def stats():
-    stats_data = load_stats()
-    return render_template("stats.html", stats=stats_data)
+    page = max(request.args.get("page", 1, type=int), 1)
+    total = stats_store.count()
+    return render_template(
+        "stats.html",
+        stats=stats_store.rows(STATS_PAGE_SIZE, (page - 1) * STATS_PAGE_SIZE, newest_first=True),
+        summary=stats_store.summary(),
+        page=page,
+        pages=max(1, -(-total // STATS_PAGE_SIZE))
+    )
+
 
 
+# Background index rebuild state, read by /rebuild-index/status
+rebuild_state = {"state": "idle"}
+rebuild_lock = threading.Lock()
+
+
+PREPARE_DATA_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prepare_data.py")
+PROGRESS_MARKER = "@@progress "  # prepare_data.PROGRESS_MARKER, without importing its ingest dependencies
+
+
+def run_prepare_data(full):
+    """Run prepare_data.py in a child process and return the generation it activated (or None).
+
+    A subprocess rather than in-process, so its extraction pool can fork from a
+    single-threaded process instead of this one with its model and server threads.
+    """
+    command = [sys.executable, "-u", PREPARE_DATA_SCRIPT, "--progress-json"]
+    if full:
+        command.append("--full")
+    workers = load_config().get("index_workers")
+    if workers:
+        command += ["--workers", str(workers)]
+    name, last_line = None, ""
+    with subprocess.Popen(command, cwd=os.path.dirname(PREPARE_DATA_SCRIPT), stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, text=True) as child:
+        for line in child.stdout:
+            line = line.rstrip("\n")
+            if not line.startswith(PROGRESS_MARKER):
+                print(line)  # The build's own log, as before
+                last_line = line or last_line
+                continue
+            update = json.loads(line[len(PROGRESS_MARKER):])
+            if "generation" in update:
+                name = update["generation"]
+            else:
+                rebuild_state.update(update)
+    if child.returncode != 0:
+        raise RuntimeError(last_line.lstrip("❌ ") or f"prepare_data.py exited with {child.returncode}")
+    return name
+
+
+def rebuild_index_job(full):
+    """Build a new index generation with prepare_data.py and hot-swap it in."""
+    started = time.perf_counter()
+    result = "failed"
+    try:
+        name = run_prepare_data(full)
+        if name:
+            activate_generation(name)
+            message = f"✅ Index generation {name} built and activated."
+            result = "activated"
+        else:
+            message = "✅ Index already up to date."
+            result = "up_to_date"
+        rebuild_state.update(state="succeeded", status="success", message=message, generation=name)
+    except Exception as e:
+        print(f"❌ Exception during index generation: {e}")
+        rebuild_state.update(state="failed", status="error", message=f"❌ Index generation failed: {e}")
+    finally:
+        rebuild_state["finished_at"] = datetime.now().isoformat()
+        REBUILDS.inc(result=result)
+        REBUILD_SECONDS.observe(time.perf_counter() - started)
+
 
 @app.route("/rebuild-index", methods=["POST"])
 def rebuild_index():
-    """Manual trigger to regenerate the FAISS index by calling prepare_data.py"""
-    print("📍 Index generation started via prepare_data.py...")
+    """Start a background index rebuild; poll /rebuild-index/status for progress."""
+    with rebuild_lock:
+        if rebuild_state.get("state") == "running":
+            return jsonify({"status": "error", "message": "⏳ An index rebuild is already running.", "job": dict(rebuild_state)}), 409
+
+        full = request.args.get("full") == "1"
+        rebuild_state.clear()
+        rebuild_state.update(
+            state="running",
+            status="info",
+            message="🔄 Index generation in progress...",
+            full=full,
+            stage="queued",
+            progress={},
+            started_at=datetime.now().isoformat()
+        )
+        threading.Thread(target=rebuild_index_job, args=(full,), daemon=True).start()
+
+    print("📍 Index generation started in the background...")
+    return jsonify({"status": "info", "message": rebuild_state["message"], "job": dict(rebuild_state)}), 202
+
+
+@app.route("/rebuild-index/status", methods=["GET"])
+def rebuild_index_status():
+    live = current_index()
+    return jsonify({
+        "job": dict(rebuild_state),
+        "active_generation": live.generation,
+        "previous_generation": index_generations.previous_generation(live.generation),
+        "generations": index_generations.list_generations(),
+        "vectors": live.index.ntotal if live.index is not None else 0
+    })
+
+
+@app.route("/rebuild-index/rollback", methods=["POST"])
+def rollback_index():
+    """Switch back to the generation before the live one."""
+    previous = index_generations.previous_generation(current_index().generation)
+    if not previous:
+        return jsonify({"status": "error", "message": "No previous index generation to roll back to."}), 404
     try:
-        result = subprocess.run(["python3", "backend/prepare_data.py"], capture_output=True, text=True)
+        activate_generation(previous)
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"❌ Rollback failed: {e}"}), 500
+    return jsonify({"status": "success", "message": f"↩️ Rolled back to index generation {previous}."})
 
-        if result.returncode == 0:
-            print("✅ prepare_data.py executed successfully.")
-            print(result.stdout)
-            return jsonify({"status": "success", "message": "✅ Index generated successfully!"})
-        else:
-            print("❌ prepare_data.py returned an error:")
-            print(result.stderr)
-            return jsonify({"status": "error", "message": "❌ Index generation failed."})
 
+@app.route("/rebuild-index/activate", methods=["POST"])
+def activate_index():
+    """Serve a specific generation (default: whatever CURRENT names, e.g. after a CLI build)."""
+    data = request.get_json(silent=True) or {}
+    name = data.get("generation") or index_generations.current_generation()
+    if not name or name not in index_generations.list_generations():
+        return jsonify({"status": "error", "message": f"Unknown index generation: {name}"}), 404
+    try:
+        activate_generation(name)
     except Exception as e:
-        print(f"❌ Exception during index generation: {e}")
-        return jsonify({"status": "error", "message": "❌ Internal error occurred."})
+        return jsonify({"status": "error", "message": f"❌ Activation failed: {e}"}), 500
+    return jsonify({"status": "success", "message": f"✅ Now serving index generation {name}."})
 
 
 @app.route("/cache", methods=["POST"])
@@ -882,12 +1540,66 @@ def get_cached_response():
     prompt = data.get("prompt", "").strip()
     model = data.get("model", "").strip()
     key = f"{prompt}|{model}"
-    cache = load_cache()
     return jsonify({
-        "answer": cache.get(key, "[No cached response]")
+        "answer": response_cache.get(key) or "[No cached response]"
+    })
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: 503 until warm-up has loaded every heavy component. Without warm-up
+    they load on first use instead, and the app counts as ready right away."""
+    components = {component.name: component.status() for component in COMPONENTS}
+    if warm_up_thread is None or all(component.ready for component in COMPONENTS):
+        status = "ready"
+    elif any(component.state == "failed" for component in COMPONENTS) and not warm_up_thread.is_alive():
+        status = "failed"
+    else:
+        status = "warming_up"
+    return jsonify({"status": status, "components": components}), 200 if status == "ready" else 503
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus text exposition of the pipeline metrics."""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route("/api/cache-stats", methods=["GET"])
+def cache_stats():
+    """Hit/miss counters of the in-process caches, for sizing them."""
+    return jsonify({
+        "responses": response_cache.stats(),
+        "generations": generations.stats(),
+        "semantic_responses": semantic_cache.stats() if semantic_cache is not None else None,
+        "query_embeddings": query_embedder.stats(),
+        "query_embedding_batches": query_batcher.stats() if query_batcher is not None else None,
+        "dynamic_documents": dynamic_doc_cache.stats(),
+        "chunk_embeddings": {
+            "hits": embedding_cache.hits,
+            "misses": embedding_cache.misses
+        } if embedding_cache is not None else None
     })
 
 
+@app.route("/api/scheduler", methods=["GET"])
+def scheduler_stats():
+    """Per-model active and queued Ollama requests, and how many were shed."""
+    return jsonify(scheduler.stats())
+
+
+@app.route("/api/models", methods=["GET"])
+def model_residency():
+    """Loaded models against the memory budget, and warm vs cold time to first token per model."""
+    return jsonify(residency.stats())
+
+
 @app.route("/project/<slug>/files/<filename>")
 def serve_project_file(slug, filename):
     """Serve a specific file from a project folder."""
@@ -902,9 +1614,7 @@ def serve_project_file(slug, filename):
 
 @app.route("/project/<slug>/run-step/<step>", methods=["POST"])
 def run_step(slug, step):
-    from threading import Thread
-
-    def background_job(slug, step):
+    def background_job(slug, step, trace):
         instructions_path = os.path.join("projects", slug, "instructions.json")
         with open(instructions_path) as f:
             instructions = json.load(f)
@@ -913,13 +1623,14 @@ def run_step(slug, step):
         # Gather files
         file_dir = os.path.join("projects", slug, "files")
         texts = []
-        for fname in os.listdir(file_dir):
-            if fname.endswith(".json"):
-                continue
-            fpath = os.path.join(file_dir, fname)
-            content = extract_text_from_file(fpath)
-            if content:
-                texts.append(f"--- File: {fname} ---\n{content.strip()}")
+        with trace.stage("extraction"):
+            for fname in os.listdir(file_dir):
+                if fname.endswith(".json"):
+                    continue
+                fpath = os.path.join(file_dir, fname)
+                content = extract_text_from_file(fpath)
+                if content:
+                    texts.append(f"--- File: {fname} ---\n{content.strip()}")
 
         # Add outputs from prior steps
         if step == "write":
@@ -941,26 +1652,32 @@ def run_step(slug, step):
             combined = "\n\n".join(texts)
             messages.append({"role": "user", "content": combined})
 
-        # 🔧 LOGGING: Full trace of prompt components
-        print("\n🔧 [RUN STEP] Project:", slug)
-        print("🧠 Step:", step)
-        print("🪪 System Prompt:\n", step_instructions.get("system", "").strip() or "[None]")
-        print("🧑‍💻 User Prompt:\n", step_instructions.get("user", "").strip() or "[None]")
-
-        print("📎 File Inputs:")
-        for i, text in enumerate(texts):
-            preview = text[:300].replace("\n", " ") + ("..." if len(text) > 300 else "")
-            print(f"  🔹 File {i+1}: {len(text.split())} words → {preview}")
+        # 🔧 LOGGING: Full trace of prompt components (debug level)
+        if log.isEnabledFor(logging.DEBUG):
+            trace.log.debug("🔧 [RUN STEP] Project: %s", slug)
+            trace.log.debug("🧠 Step: %s", step)
+            trace.log.debug("🪪 System Prompt:\n%s", step_instructions.get("system", "").strip() or "[None]")
+            trace.log.debug("🧑‍💻 User Prompt:\n%s", step_instructions.get("user", "").strip() or "[None]")
 
-        print("🧵 Final Messages Sent to LLM:")
-        for m in messages:
-            role = m["role"]
-            snippet = m["content"][:200].replace("\n", " ") + ("..." if len(m["content"]) > 200 else "")
-            print(f"  [{role.upper()}] {snippet}")
+            trace.log.debug("📎 File Inputs:")
+            for i, text in enumerate(texts):
+                preview = text[:300].replace("\n", " ") + ("..." if len(text) > 300 else "")
+                trace.log.debug(f"  🔹 File {i+1}: {len(text.split())} words → {preview}")
 
-        # Run LLM call
-        response = ollama.chat(model="llama3", messages=messages)
+            trace.log.debug("🧵 Final Messages Sent to LLM:")
+            for m in messages:
+                role = m["role"]
+                snippet = m["content"][:200].replace("\n", " ") + ("..." if len(m["content"]) > 200 else "")
+                trace.log.debug(f"  [{role.upper()}] {snippet}")
+
+        # Run LLM call, behind any interactive requests for the model
+        with trace.stage("queue"):
+            slot = scheduler.acquire("llama3", BACKGROUND)
+        with slot:
+            residency.prepare("llama3")
+            response = scheduler.client.chat(model="llama3", messages=messages, keep_alive=residency.keep_alive("llama3"))
         output = response["message"]["content"]
+        observe_generation("llama3", "Project Step", trace, None, ollama_metrics(response))
 
         # Save output
         output_path = os.path.join("projects", slug, "outputs")
@@ -968,6 +1685,16 @@ def run_step(slug, step):
         with open(os.path.join(output_path, f"{step}.md"), "w") as f:
             f.write(output.strip())
 
+        save_stat({
+            "question": f"{slug}/{step}",
+            "model": "llama3",
+            "response_time_ms": round(trace.elapsed_ms(), 2),
+            "timestamp": datetime.now().isoformat(),
+            "source": "Project Step",
+            **trace.record(),
+            **ollama_metrics(response)
+        })
+
     # ✅ Validate and trigger async job
     step = step.lower()
     if step not in ["plan", "write", "check"]:
@@ -977,9 +1704,31 @@ def run_step(slug, step):
     if not os.path.exists(instructions_path):
         return jsonify({"status": "error", "message": "No instructions found"}), 404
 
-    Thread(target=background_job, args=(slug, step)).start()
+    def tracked_job(slug, step, trace):
+        RUN_STEP_JOBS.inc()
+        try:
+            with trace.profiled():
+                background_job(slug, step, trace)
+            count_outcome(trace, "run_step", "generated")
+        except Exception as e:
+            trace.log.error(f"❌ Step {step} of {slug} failed: {e}")
+            count_outcome(trace, "run_step", "error")
+        finally:
+            RUN_STEP_JOBS.dec()
+            trace.finish(project=slug, step=step)
+
+    trace = start_trace("run_step", request.headers, current_config().get("tracing", {}), observe_stage)
+    try:
+        scheduler.check("llama3", BACKGROUND)
+    except Overloaded as e:
+        count_outcome(trace, "run_step", "shed")
+        trace.finish(project=slug, step=step)
+        return overloaded_response(e, {"status": "error", "message": str(e)})
+    executor.submit(tracked_job, slug, step, trace)
 
-    return jsonify({"status": "success", "message": "Step queued for background execution."})
+    response = jsonify({"status": "success", "message": "Step queued for background execution."})
+    response.headers["X-Request-ID"] = trace.request_id
+    return response
 
 @app.route("/project/<slug>/output/<step>")
 def view_output(slug, step):
@@ -991,6 +1740,7 @@ def view_output(slug, step):
     with open(output_path, "r") as f:
         markdown_text = f.read()
 
+    import markdown
     html = markdown.markdown(markdown_text, extensions=["fenced_code", "tables"])
     return render_template("project_output.html", slug=slug, step=step, content=html)
 
@@ -999,15 +1749,25 @@ def view_output(slug, step):
 # Add route to expose raw stats.json data as JSON
 @app.route("/api/stats", methods=["GET"])
 def api_stats():
-    """Return raw stats.json data as JSON."""
-    stats_data = load_stats()
-    return jsonify(stats_data)
+    """Return a page of raw stat rows as JSON."""
+    return jsonify(paged_stats())
 
 @app.route("/list-stats", methods=["GET"])
 def list_stats():
     """Alias route for Next.js frontend to fetch stats"""
-    stats_data = load_stats()
-    return jsonify(stats_data)
+    return jsonify(paged_stats())
+
+@app.route("/api/stats/summary", methods=["GET"])
+def stats_summary():
+    """Counts, p50/p90/p99 latency and tokens/s per group, from the incremental rollups.
+
+    ?group_by=model,source  ?bucket=hour|day|month  ?since=2025-06-01  ?until=2025-06-30 (inclusive)
+    """
+    group_by = [field for field in request.args.get("group_by", "model,source").split(",") if field]
+    bucket = request.args.get("bucket") or None
+    if bucket and bucket not in BUCKET_FORMATS:
+        return jsonify({"status": "error", "message": f"bucket must be one of {sorted(BUCKET_FORMATS)}"}), 400
+    return jsonify(stats_store.summary(group_by, bucket, request.args.get("since"), request.args.get("until")))
 
 # app.py
 @app.route("/api/project/<slug>")
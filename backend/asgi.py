@@ -0,0 +1,181 @@
+"""ASGI entry point: the streaming routes run on an asyncio event loop, the rest is the Flask app.
+
+    cd backend && uvicorn asgi:application --port 5000
+
+POST /ask and POST /analyze-image still go through their Flask views (validation,
+caches, retrieval) on a worker thread, but the views hand back an async body and the
+tokens are then streamed from Ollama's AsyncClient and to the client on the event
+loop, so an open stream costs a coroutine rather than a thread. Every other route
+is served by the Flask app through asgiref's WSGI adapter, unchanged.
+"""
+import io
+import sys
+import asyncio
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app, scheduler
+from metrics import REGISTRY
+from streaming import ASYNC_STREAM_KEY
+from tracing import log
+
+STREAMING_ROUTES = {("POST", "/ask"), ("POST", "/analyze-image")}
+
+OPEN_STREAMS = REGISTRY.gauge("rag_asgi_streams_open", "Responses currently streaming from the ASGI server.",
+                              ["endpoint"])
+DISCONNECTS = REGISTRY.counter("rag_asgi_client_disconnects_total",
+                               "Streams abandoned by the client before they finished.", ["endpoint"])
+
+flask_app = WsgiToAsgi(app)
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI HTTP request whose body has been read in full."""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        ASYNC_STREAM_KEY: True
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin1"), value.decode("latin1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def dispatch(environ):
+    """Run the Flask view. Streaming bodies are left to the event loop; anything else
+    (cached answers, validation errors) is rendered here, inside the request context."""
+    with app.request_context(environ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            response = app.make_response(app.handle_exception(e))
+        streaming = hasattr(response, "async_body")
+        body = None if streaming else response.get_data()
+        headers = [(name.lower().encode("latin1"), value.encode("latin1"))
+                   for name, value in response.get_wsgi_headers(environ).items()
+                   if not (streaming and name.lower() == "content-length")]  # The empty placeholder body's
+    return response, headers, body
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def start_body(response):
+    """Call a streaming response's async_body, which starts its producer (the /ask leader's
+    generation), and return the chunks to send."""
+    return response.async_body(scheduler.async_client())
+
+
+def start_orphaned_body(dispatched):
+    """Done callback of a dispatch whose request was cancelled meanwhile: the view may have
+    made it a flight's leader, so its generation still has to run for those who joined."""
+    if dispatched.cancelled() or dispatched.exception() is not None:
+        return
+    response, _, rendered = dispatched.result()
+    if rendered is None:
+        start_body(response)
+
+
+async def stream_route(scope, receive, send):
+    endpoint = scope["path"].strip("/")
+    body = await read_body(receive)
+    if body is None:
+        return
+    environ = wsgi_environ(scope, body)
+    dispatched = asyncio.ensure_future(asyncio.to_thread(dispatch, environ))
+    try:
+        response, headers, rendered = await asyncio.shield(dispatched)
+    except asyncio.CancelledError:
+        dispatched.add_done_callback(start_orphaned_body)
+        raise
+    # Started before the first send, so a send that fails (or is cancelled on shutdown)
+    # can't leave requests that joined this generation waiting on a flight nobody runs
+    chunks = start_body(response) if rendered is None else None
+    await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+    if rendered is not None:
+        await send({"type": "http.response.body", "body": rendered})
+        return
+
+    async def pump():
+        async for chunk in chunks:
+            if chunk:
+                # Awaiting send is the backpressure: the server pauses us while the socket's
+                # write buffer is full, and the flight keeps coalescing tokens meanwhile, so
+                # a slow reader gets fewer, larger chunks and never stalls the generation
+                await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    OPEN_STREAMS.inc(endpoint=endpoint)
+    streaming = asyncio.ensure_future(pump())
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({streaming, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if not streaming.done():
+            # The generation of /ask runs on as its own task, to be cached for everyone else
+            log.info("🔌 Client disconnected from /%s", endpoint)
+            DISCONNECTS.inc(endpoint=endpoint)
+            streaming.cancel()
+        try:
+            await streaming
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            log.error(f"❌ Streaming /{endpoint} failed: {e}")
+    finally:
+        disconnected.cancel()
+        OPEN_STREAMS.dec(endpoint=endpoint)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await scheduler.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and (scope["method"], scope["path"]) in STREAMING_ROUTES:
+        await stream_route(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
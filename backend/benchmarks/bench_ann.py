@@ -0,0 +1,110 @@
+"""Recall@k and search-latency benchmark of the configurable ANN index types against IndexFlatL2.
+
+Runs on a synthetic clustered corpus shaped like our MiniLM embeddings, one query at a
+time (as /ask searches), so p50/p99 reflect what a request actually pays.
+
+    python backend/benchmarks/bench_ann.py --n 1000000 --queries 1000
+    python backend/benchmarks/bench_ann.py --types ivf_flat hnsw --nprobe 8 32 --ef-search 32 128
+"""
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from index_factory import DEFAULT_INDEX_SETTINGS, create_index, train_index, apply_search_params
+
+
+def synthetic_corpus(n, dim, n_queries, clusters=256, latent_dim=32, seed=0):
+    """Clustered points in a low-dimensional latent space, projected up to dim and
+    L2-normalised. Sentence embeddings have low intrinsic dimension; isotropic noise in
+    all 384 dims would make every neighbour equidistant and understate PQ/IVF recall."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, latent_dim)).astype(np.float32)
+    projection = rng.standard_normal((latent_dim, dim)).astype(np.float32)
+
+    def sample(count):
+        latent = centres[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, latent_dim)).astype(np.float32)
+        points = latent @ projection + 0.05 * rng.standard_normal((count, dim)).astype(np.float32)
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    return sample(n), sample(n_queries)
+
+def time_queries(index, queries, k):
+    """Search queries one by one; returns (ids, per-query latencies in ms)."""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies = np.empty(len(queries))
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, found = index.search(queries[i:i + 1], k)
+        latencies[i] = (time.perf_counter() - start) * 1000
+        ids[i] = found[0]
+    return ids, latencies
+
+def recall_at_k(found, truth):
+    hits = sum(len(np.intersect1d(f[f != -1], t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def index_bytes(index):
+    return len(faiss.serialize_index(index))
+
+
+def variants(args):
+    """Yield (label, settings) for every requested type x search-parameter combination."""
+    for kind in args.types:
+        base = dict(DEFAULT_INDEX_SETTINGS, type=kind, nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+        if kind in {"ivf_flat", "ivf_pq"}:
+            for nprobe in args.nprobe:
+                yield f"{kind} nlist={args.nlist} nprobe={nprobe}", dict(base, nprobe=nprobe)
+        elif kind == "hnsw":
+            for ef in args.ef_search:
+                yield f"hnsw M={args.hnsw_m} efSearch={ef}", dict(base, ef_search=ef)
+        else:
+            yield "flat", base
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ANN index settings against exact IndexFlatL2.")
+    parser.add_argument("--n", type=int, default=200000, help="corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="embedding dim (all-MiniLM-L6-v2 = 384)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3, help="/ask retrieves k=3")
+    parser.add_argument("--types", nargs="+", default=["ivf_flat", "ivf_pq", "hnsw"])
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--pq-m", type=int, default=DEFAULT_INDEX_SETTINGS["pq_m"])
+    parser.add_argument("--hnsw-m", type=int, default=DEFAULT_INDEX_SETTINGS["hnsw_m"])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    args = parser.parse_args()
+
+    print(f"🧪 Generating {args.n} x {args.dim} corpus and {args.queries} queries...")
+    corpus, queries = synthetic_corpus(args.n, args.dim, args.queries)
+    ids = np.arange(args.n, dtype=np.int64)
+
+    flat = faiss.IndexFlatL2(args.dim)
+    flat.add(corpus)
+    truth, flat_latency = time_queries(flat, queries, args.k)
+
+    rows = [("IndexFlatL2 (baseline)", 0.0, 1.0, flat_latency, index_bytes(flat))]
+    for label, settings in variants(args):
+        start = time.perf_counter()
+        index = create_index(args.dim, settings, args.n)
+        train_index(index, corpus, settings)
+        index.add_with_ids(corpus, ids)
+        build_s = time.perf_counter() - start
+
+        apply_search_params(index, settings)
+        found, latency = time_queries(index, queries, args.k)
+        rows.append((label, build_s, recall_at_k(found, truth), latency, index_bytes(index)))
+
+    print(f"\n{'index':<36} {'build s':>8} {f'recall@{args.k}':>9} {'p50 ms':>8} {'p99 ms':>8} {'size MB':>8}")
+    for label, build_s, recall, latency, size in rows:
+        print(f"{label:<36} {build_s:>8.1f} {recall:>9.3f} {np.percentile(latency, 50):>8.3f} "
+              f"{np.percentile(latency, 99):>8.3f} {size / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Speed and parity of the embedding backends against fp32.
+
+Embeds a sample of the live index's chunks (or --texts, one per line) and a set of
+queries with fp32 and each candidate backend, and reports:
+
+  chunks/s   encoding throughput (and the speedup over fp32)
+  drift      1 - cosine(fp32 vector, candidate vector), mean / p99 / max over all texts
+  overlap    mean |top-k fp32 ∩ top-k candidate| / k, each backend searching its own vectors
+
+Queries default to the opening words of sampled chunks; pass real ones with --queries.
+Exits 1 if a backend's overlap falls below --min-overlap, so a switch that hurts
+retrieval doesn't go unnoticed.
+
+    python backend/benchmarks/bench_embedding_backends.py --backends int8 onnx
+    python backend/benchmarks/bench_embedding_backends.py --export-onnx   # writes embedding.onnx_path first
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import index_generations
+from chunk_store import ChunkStore, store_exists
+from embedding_backends import BACKENDS, embedding_settings, resolve_backend, load_model, export_onnx
+
+CONFIG_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "config.json"))
+
+
+def load_config():
+    with open(CONFIG_FILE) as f:
+        return json.load(f)
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def sample_chunks(n, seed):
+    directory = index_generations.current_index_dir()
+    if not store_exists(directory):
+        sys.exit("❌ No index to sample chunks from; build one or pass --texts.")
+    store = ChunkStore(directory)
+    texts = [text for _, text in store.items()]
+    store.close()
+    random.Random(seed).shuffle(texts)
+    return texts[:n]
+
+
+def embed(model, texts, batch_size):
+    started = time.perf_counter()
+    vectors = np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    elapsed = time.perf_counter() - started
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors, len(texts) / elapsed
+
+
+def top_k(corpus, queries, k):
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends with fp32.")
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx"], choices=BACKENDS[1:])
+    parser.add_argument("--corpus", type=int, default=2000, help="Chunks sampled from the live index")
+    parser.add_argument("--texts", help="File of corpus texts, one per line, instead of the index")
+    parser.add_argument("--queries", help="File of queries, one per line")
+    parser.add_argument("--num-queries", type=int, default=200, help="Pseudo-queries when --queries is not given")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--min-overlap", type=float, default=0.9)
+    parser.add_argument("--export-onnx", action="store_true", help="Export the ONNX model to embedding.onnx_path first")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    settings = embedding_settings(load_config())
+    if args.export_onnx:
+        print(f"📦 Exported ONNX model to {export_onnx(settings)}")
+
+    corpus = read_lines(args.texts) if args.texts else sample_chunks(args.corpus, args.seed)
+    if args.queries:
+        queries = read_lines(args.queries)
+    else:
+        sampled = random.Random(args.seed + 1).sample(corpus, min(args.num_queries, len(corpus)))
+        queries = [" ".join(text.split()[:12]) for text in sampled]
+    k = min(args.k, len(corpus))
+    print(f"🧪 {len(corpus)} chunks, {len(queries)} queries, overlap@{k}")
+
+    reference = load_model("fp32", settings)
+    reference.encode(["warm-up"])
+    ref_corpus, ref_speed = embed(reference, corpus, args.batch_size)
+    ref_queries, _ = embed(reference, queries, args.batch_size)
+    ref_top = top_k(ref_corpus, ref_queries, k)
+
+    print(f"\n{'backend':<8} {'chunks/s':>9} {'speedup':>8} {'drift mean':>11} {'p99':>9} {'max':>9} {'overlap':>8}")
+    print(f"{'fp32':<8} {ref_speed:>9.0f} {1:>7.2f}x {0:>11.2e} {0:>9.2e} {0:>9.2e} {1:>8.3f}")
+    failed = []
+    for backend in args.backends:
+        if resolve_backend(dict(settings, backend=backend)) != backend:
+            print(f"{backend:<8} skipped (not available)")
+            continue
+        model = load_model(backend, settings)
+        model.encode(["warm-up"])
+        cand_corpus, speed = embed(model, corpus, args.batch_size)
+        cand_queries, _ = embed(model, queries, args.batch_size)
+
+        drift = 1 - np.concatenate([(ref_corpus * cand_corpus).sum(axis=1), (ref_queries * cand_queries).sum(axis=1)])
+        cand_top = top_k(cand_corpus, cand_queries, k)
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)])
+        print(f"{backend:<8} {speed:>9.0f} {speed / ref_speed:>7.2f}x {drift.mean():>11.2e} "
+              f"{np.percentile(drift, 99):>9.2e} {drift.max():>9.2e} {overlap:>8.3f}")
+        if overlap < args.min_overlap:
+            failed.append(backend)
+
+    if failed:
+        print(f"\n❌ Retrieval overlap below {args.min_overlap} for: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"\n✅ Every tested backend keeps overlap@{k} at or above {args.min_overlap}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""BM25 index build and query latency, next to dense search and RRF fusion.
+
+Builds the lexical index prepare_data.py writes over a synthetic corpus (Zipf-
+distributed words plus part-number-like tokens) or the live index's chunks, then
+times queries through each retrieval mode's search step:
+
+  build     tokenizing and indexing every chunk, and the size on disk
+  load      LexicalIndex.load (the vocabulary is read, the rest mmapped)
+  lexical   BM25 top-k
+  dense     a flat FAISS search over random vectors of the same count (the embedding
+            call, which lexical mode skips, is not included)
+  hybrid    both plus reciprocal-rank fusion
+
+    python backend/benchmarks/bench_lexical.py --n 200000
+    python backend/benchmarks/bench_lexical.py --live --queries 500
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import index_generations
+from chunk_store import ChunkStore, store_exists
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+
+def synthetic_corpus(n, words_per_chunk, vocab_size, seed):
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"word{i}" for i in range(vocab_size)])
+    ranks = np.minimum(rng.zipf(1.3, size=(n, words_per_chunk)) - 1, vocab_size - 1)
+    for chunk_id, row in enumerate(ranks):
+        words = vocab[row].tolist()
+        words[rng.integers(words_per_chunk)] = f"PN-{rng.integers(100000):05d}"
+        yield chunk_id, " ".join(words)
+
+
+def live_corpus():
+    directory = index_generations.current_index_dir()
+    if not store_exists(directory):
+        sys.exit("❌ No live index; drop --live to use a synthetic corpus.")
+    store = ChunkStore(directory)
+    items = list(store.items())
+    store.close()
+    return items
+
+
+def percentiles(samples):
+    ms = np.asarray(samples) * 1000
+    return f"{np.percentile(ms, 50):>8.3f} {np.percentile(ms, 99):>8.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the BM25 index against dense retrieval.")
+    parser.add_argument("--n", type=int, default=100000, help="Synthetic chunks")
+    parser.add_argument("--words", type=int, default=80, help="Words per synthetic chunk (~500 characters)")
+    parser.add_argument("--vocab", type=int, default=50000)
+    parser.add_argument("--live", action="store_true", help="Index the live generation's chunks instead")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=20, help="Candidates per retriever")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    items = live_corpus() if args.live else list(synthetic_corpus(args.n, args.words, args.vocab, args.seed))
+    texts = [text for _, text in items]
+    rng = random.Random(args.seed)
+    # Keyword-style queries: a few words lifted from a random chunk
+    queries = []
+    for _ in range(args.queries):
+        words = rng.choice(texts).split()
+        start = rng.randrange(max(1, len(words) - 4))
+        queries.append(" ".join(words[start:start + 4]))
+
+    directory = tempfile.mkdtemp(prefix="bench_lexical_")
+    try:
+        started = time.perf_counter()
+        LexicalIndex.build(items).save(directory)
+        build_seconds = time.perf_counter() - started
+        size_mb = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)) / 2**20
+        corpus_mb = sum(len(text.encode("utf-8")) for text in texts) / 2**20
+
+        started = time.perf_counter()
+        lexical = LexicalIndex.load(directory)
+        load_seconds = time.perf_counter() - started
+
+        vectors = np.random.default_rng(args.seed).standard_normal((len(items), args.dim), dtype=np.float32)
+        dense = faiss.IndexIDMap(faiss.IndexFlatL2(args.dim))
+        dense.add_with_ids(vectors, np.arange(len(items), dtype=np.int64))
+        query_vectors = vectors[np.random.default_rng(args.seed + 1).integers(len(items), size=len(queries))]
+
+        timings = {"lexical": [], "dense": [], "hybrid": []}
+        for query, vector in zip(queries, query_vectors):
+            started = time.perf_counter()
+            _, lexical_ids = lexical.search(query, args.k)
+            lexical_done = time.perf_counter()
+            _, dense_ids = dense.search(vector[np.newaxis, :], args.k)
+            dense_done = time.perf_counter()
+            reciprocal_rank_fusion([dense_ids[0].tolist(), lexical_ids.tolist()])
+            fused = time.perf_counter()
+            timings["lexical"].append(lexical_done - started)
+            timings["dense"].append(dense_done - lexical_done)
+            timings["hybrid"].append(fused - started)
+    finally:
+        shutil.rmtree(directory)
+
+    print(f"🧪 {len(items)} chunks ({corpus_mb:.1f} MB of text), {len(lexical.vocab)} terms, "
+          f"{len(queries)} queries, k={args.k}")
+    print(f"\n🔤 Build {build_seconds:.2f}s ({len(items) / build_seconds:.0f} chunks/s), "
+          f"{size_mb:.1f} MB on disk, load {load_seconds * 1000:.1f} ms")
+    print(f"\n{'mode':<8} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode, samples in timings.items():
+        print(f"{mode:<8} {percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    main()
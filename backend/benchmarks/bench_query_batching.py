@@ -0,0 +1,93 @@
+"""Query-embedding throughput and tail latency with and without micro-batching.
+
+N threads each embed distinct prompts back to back, as concurrent /ask requests
+missing the query cache would, through:
+
+  direct    every request calls the model itself (the model runs one call at a time)
+  batched   requests go through EmbeddingBatcher, which encodes them together
+
+By default the model is a stub whose call costs --call-ms plus --per-text-ms per
+text, roughly all-MiniLM-L6-v2 on a CPU; --real uses the actual model.
+
+    python backend/benchmarks/bench_query_batching.py --concurrency 1 4 16 64
+    python backend/benchmarks/bench_query_batching.py --real --max-wait-ms 3 --max-batch-size 64
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from embed_batcher import EmbeddingBatcher
+
+
+def stub_model(call_ms, per_text_ms):
+    lock = threading.Lock()  # One model: concurrent calls queue for the cores
+
+    def encode(texts):
+        with lock:
+            time.sleep((call_ms + per_text_ms * len(texts)) / 1000)
+        return np.ones((len(texts), 384), dtype=np.float32)
+    return encode
+
+
+def real_model():
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    model.encode(["warm-up"])
+    return model.encode
+
+
+def run(encode, concurrency, per_thread):
+    """Returns (queries per second, latencies in ms)."""
+    latencies = [[] for _ in range(concurrency)]
+    start = threading.Barrier(concurrency + 1)
+
+    def worker(n):
+        start.wait()
+        for i in range(per_thread):
+            began = time.perf_counter()
+            encode([f"question {i} from client {n}: how are the documents indexed?"])
+            latencies[n].append((time.perf_counter() - began) * 1000)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return concurrency * per_thread / elapsed, np.concatenate([np.asarray(l) for l in latencies])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark micro-batched query embedding.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=512, help="Queries per concurrency level")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=2)
+    parser.add_argument("--call-ms", type=float, default=5.0, help="Stub model: fixed cost per call")
+    parser.add_argument("--per-text-ms", type=float, default=0.3, help="Stub model: cost per text")
+    parser.add_argument("--real", action="store_true", help="Use all-MiniLM-L6-v2 instead of the stub")
+    args = parser.parse_args()
+
+    encode = real_model() if args.real else stub_model(args.call_ms, args.per_text_ms)
+    print(f"🧪 {args.requests} queries per level, batches of up to {args.max_batch_size} "
+          f"within {args.max_wait_ms} ms ({'real model' if args.real else 'stub model'})")
+    print(f"\n{'clients':>7} {'mode':<8} {'q/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    for concurrency in args.concurrency:
+        per_thread = max(1, args.requests // concurrency)
+        batcher = EmbeddingBatcher(encode, args.max_batch_size, args.max_wait_ms)
+        for mode, fn in [("direct", encode), ("batched", batcher.encode)]:
+            throughput, latencies = run(fn, concurrency, per_thread)
+            batch = batcher.stats()["mean_batch_size"] if mode == "batched" else 1
+            print(f"{concurrency:>7} {mode:<8} {throughput:>9.0f} {np.percentile(latencies, 50):>8.2f} "
+                  f"{np.percentile(latencies, 99):>8.2f} {batch:>6}")
+
+
+if __name__ == "__main__":
+    main()
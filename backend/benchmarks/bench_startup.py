@@ -0,0 +1,96 @@
+"""Startup cost of app.py: import time, time to ready, and the first query's retrieval.
+
+Each run starts a fresh interpreter and measures:
+
+  import    `import app`, i.e. until Flask can serve
+  ready     until /readyz answers 200 (warm-up has loaded every heavy component)
+  first     embedding and searching a first query, as the first /ask would (no LLM call)
+
+with warm-up on (first query after ready) and off (first query pays for the loads).
+Save a run as a baseline and compare later runs against it to catch regressions:
+
+    python backend/benchmarks/bench_startup.py --runs 3 --save startup_baseline.json
+    python backend/benchmarks/bench_startup.py --compare startup_baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import statistics
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Runs in the child interpreter; prints one JSON line of timings in seconds
+PROBE = r"""
+import json, time, numpy as np
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+if app.warm_up_thread is not None:
+    while client.get("/readyz").status_code != 200 and app.warm_up_thread.is_alive():
+        time.sleep(0.005)
+ready = time.perf_counter()
+vector = app.query_embedder.encode("What does the first question cost?")
+live = app.current_index()
+if live.index is not None:
+    live.index.search(vector[np.newaxis, :], k=3)
+first = time.perf_counter()
+print(json.dumps({"import": imported - started, "ready": ready - started, "first": first - ready}))
+"""
+
+METRICS = ("import", "ready", "first")
+
+
+def probe(warm_up):
+    env = dict(os.environ, RAG_WARM_UP="1" if warm_up else "0")
+    env.setdefault("RAG_LOG_LEVEL", "ERROR")
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app.py startup and first-query time.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per mode; the median is reported")
+    parser.add_argument("--save", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    print(f"🧪 Starting app.py {args.runs}x per mode...")
+    results = {}
+    for mode, warm in [("warm_up", True), ("lazy", False)]:
+        runs = [probe(warm) for _ in range(args.runs)]
+        results[mode] = {metric: statistics.median(run[metric] for run in runs) for metric in METRICS}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print(f"\n{'mode':<8} {'import s':>9} {'ready s':>9} {'first ms':>9}")
+    regressions = []
+    for mode, timings in results.items():
+        print(f"{mode:<8} {timings['import']:>9.2f} {timings['ready']:>9.2f} {timings['first'] * 1000:>9.1f}")
+        for metric in METRICS:
+            before = (baseline or {}).get(mode, {}).get(metric)
+            # Ignore sub-50 ms figures, which are mostly noise
+            if before and timings[metric] > max(before * (1 + args.tolerance), before + 0.05):
+                regressions.append(f"{mode}.{metric}: {before:.3f}s -> {timings[metric]:.3f}s")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Saved to {args.save}")
+    if baseline is not None:
+        if regressions:
+            print("\n❌ Slower than the baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"\n✅ Within {args.tolerance:.0%} of {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
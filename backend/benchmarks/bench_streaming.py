@@ -0,0 +1,116 @@
+"""Token-streaming throughput of /ask's response path against a stub LLM.
+
+Serves a stub generation through a minimal Flask app (the same Flight fan-out and
+framing /ask uses) and reads it back with the test client, comparing:
+
+  legacy  one write per token with the old 10 ms sleep and `collected +=`
+  text    plain-text chunks coalesced by flush_chars / flush_interval
+  sse     the same as Server-Sent Events, ending with a stats event
+
+    python backend/benchmarks/bench_streaming.py --tokens 20000
+    python backend/benchmarks/bench_streaming.py --token-delay-ms 0.5 --flush-chars 64 --flush-interval-ms 10
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from flask import Flask, Response, request, stream_with_context
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from single_flight import Flight
+from streaming import text_stream, sse_stream, STREAM_HEADERS
+
+
+def stub_llm(tokens, delay):
+    """Ollama-shaped chat chunks."""
+    for i in range(tokens):
+        if delay:
+            time.sleep(delay)
+        yield {"message": {"content": f"tok{i % 10} "}}
+    yield {"message": {"content": ""}, "done": True, "eval_count": tokens}
+
+
+def create_app(tokens, delay, flush):
+    app = Flask(__name__)
+
+    @app.route("/legacy")
+    def legacy():
+        def stream_response():
+            collected = ""
+            for chunk in stub_llm(tokens, delay):
+                piece = chunk.get("message", {}).get("content", "")
+                if not piece:
+                    continue
+                collected += piece
+                yield piece
+                time.sleep(0.01)
+        return Response(stream_with_context(stream_response()), content_type="text/plain")
+
+    @app.route("/flight")
+    def flight_route():
+        flight = Flight()
+
+        def generate():
+            collected = []
+            started = time.perf_counter()
+            for chunk in stub_llm(tokens, delay):
+                piece = chunk.get("message", {}).get("content", "")
+                if piece:
+                    collected.append(piece)
+                    flight.publish(piece)
+            "".join(collected)
+            flight.finish(summary={"eval_count": tokens, "response_time_ms": (time.perf_counter() - started) * 1000})
+
+        threading.Thread(target=generate, daemon=True).start()
+        if request.args.get("format") == "sse":
+            return Response(stream_with_context(sse_stream(flight, **flush)), content_type="text/event-stream",
+                            headers=STREAM_HEADERS)
+        return Response(stream_with_context(text_stream(flight, **flush)), content_type="text/plain",
+                        headers=STREAM_HEADERS)
+
+    return app
+
+
+def run(client, path, tokens):
+    started = time.perf_counter()
+    response = client.get(path, buffered=False)
+    first = None
+    writes = size = 0
+    for chunk in response.response:
+        if first is None:
+            first = time.perf_counter() - started
+        writes += 1
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    return tokens / elapsed, writes, first * 1000, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /ask token streaming against a stub LLM.")
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--legacy-tokens", type=int, default=300, help="The legacy path is capped at ~100 tokens/s")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="Stub generation time per token")
+    parser.add_argument("--flush-chars", type=int, default=256)
+    parser.add_argument("--flush-interval-ms", type=float, default=25)
+    args = parser.parse_args()
+
+    flush = {"flush_chars": args.flush_chars, "flush_interval": args.flush_interval_ms / 1000}
+    delay = args.token_delay_ms / 1000
+    print(f"🧪 Streaming {args.tokens} stub tokens ({args.token_delay_ms} ms/token), "
+          f"flush at {args.flush_chars} chars or {args.flush_interval_ms} ms...")
+
+    print(f"\n{'mode':<8} {'tokens':>8} {'tokens/s':>12} {'writes':>8} {'first ms':>9} {'KB':>8}")
+    for mode, path, tokens in [
+        ("legacy", "/legacy", args.legacy_tokens),
+        ("text", "/flight", args.tokens),
+        ("sse", "/flight?format=sse", args.tokens)
+    ]:
+        client = create_app(tokens, delay, flush).test_client()
+        rate, writes, first_ms, size = run(client, path, tokens)
+        print(f"{mode:<8} {tokens:>8} {rate:>12,.0f} {writes:>8} {first_ms:>9.2f} {size / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
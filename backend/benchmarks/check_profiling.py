@@ -0,0 +1,81 @@
+"""Check that an X-Profile: 1 request to /ask profiles its background generation too.
+
+Posts profiled /ask requests to the app against a stub LLM, with caching and stats
+writes off, and inspects each dumped profile. A profile is complete when it has
+frames from both ask()'s thread (answer_question) and the generation thread
+(stream_answer). Exits 1 if any is missing them.
+
+    python backend/benchmarks/check_profiling.py --requests 20
+"""
+import argparse
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import app
+
+REQUIRED_FRAMES = ("answer_question", "stream_answer")
+
+
+def stub_chat(**kwargs):
+    """Ollama-shaped chat chunks."""
+    for i in range(20):
+        time.sleep(0.001)
+        yield {"message": {"content": f"tok{i} "}}
+    yield {"message": {"content": ""}, "done": True, "eval_count": 20}
+
+
+def wait_for(path, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    time.sleep(0.05)  # The dump is written in place; let it complete
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that /ask profiles include the generation thread.")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--model", default="llama3")
+    args = parser.parse_args()
+
+    profile_dir = tempfile.mkdtemp(prefix="check_profiling_")
+    config = dict(app.current_config(), enable_cache=False)
+    config["tracing"] = dict(config.get("tracing", {}), profiling=True, profile_dir=profile_dir)
+    app.current_config = lambda: config
+    app.save_stat = lambda record: None
+    app.residency.prepare = lambda model: None
+    app.scheduler.client.chat = stub_chat
+    client = app.app.test_client()
+
+    incomplete = 0
+    try:
+        for i in range(args.requests):
+            response = client.post("/ask", data={"prompt": f"Profiling check {i}", "models": args.model},
+                                   headers={"X-Profile": "1"})
+            response.get_data()
+            path = os.path.join(profile_dir, f"ask-{response.headers['X-Request-ID']}.prof")
+            if not wait_for(path):
+                print(f"❌ No profile written for request {i}")
+                incomplete += 1
+                continue
+            functions = {name for _, _, name in pstats.Stats(path).stats}
+            missing = [frame for frame in REQUIRED_FRAMES if frame not in functions]
+            if missing:
+                print(f"❌ Request {i}: profile has no {', '.join(missing)} frames")
+                incomplete += 1
+    finally:
+        shutil.rmtree(profile_dir)
+
+    print(f"🔬 {args.requests - incomplete}/{args.requests} profiles include the generation thread")
+    sys.exit(1 if incomplete else 0)
+
+
+if __name__ == "__main__":
+    main()
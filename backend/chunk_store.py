@@ -0,0 +1,126 @@
+import os
+import mmap
+import pickle
+from array import array
+import numpy as np
+
+
+def store_paths(directory, prefix="chunks"):
+    base = os.path.join(directory, prefix)
+    return base + ".bin", base + ".ids.npy", base + ".offsets.npy"
+
+def store_exists(directory, prefix="chunks"):
+    return all(os.path.exists(p) for p in store_paths(directory, prefix))
+
+
+class ChunkStore:
+    """Read-only, id-addressed chunk texts backed by a memory-mapped UTF-8 blob.
+
+    Opening is O(1) in corpus size: the ids/offsets arrays and the blob are mmapped, so
+    pages are shared between worker processes and only the chunks actually read get
+    decoded. Supports the subset of dict/list behaviour /ask relies on (len, [], in).
+    """
+
+    def __init__(self, directory, prefix="chunks"):
+        blob_path, ids_path, offsets_path = store_paths(directory, prefix)
+        self.ids = np.load(ids_path, mmap_mode="r")
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        self._file = open(blob_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap refuses zero-length files; an empty store just has no chunks
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        # Fresh builds number chunks 0..n-1, which lets lookups skip the binary search
+        self._dense = len(self.ids) == 0 or (self.ids[0] == 0 and self.ids[-1] == len(self.ids) - 1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _position(self, chunk_id):
+        chunk_id = int(chunk_id)
+        if self._dense:
+            pos = chunk_id if 0 <= chunk_id < len(self.ids) else -1
+        else:
+            pos = int(np.searchsorted(self.ids, chunk_id))
+            if pos >= len(self.ids) or self.ids[pos] != chunk_id:
+                pos = -1
+        return pos
+
+    def __contains__(self, chunk_id):
+        return self._position(chunk_id) != -1
+
+    def __getitem__(self, chunk_id):
+        pos = self._position(chunk_id)
+        if pos == -1:
+            raise KeyError(chunk_id)
+        return self._blob[self.offsets[pos]:self.offsets[pos + 1]].decode("utf-8")
+
+    def items(self):
+        for chunk_id, data in self.raw_items():
+            yield chunk_id, data.decode("utf-8")
+
+    def raw_items(self):
+        """Yield (id, utf-8 bytes) without decoding, for copying into a new store."""
+        for pos in range(len(self.ids)):
+            yield int(self.ids[pos]), self._blob[self.offsets[pos]:self.offsets[pos + 1]]
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
+
+
+class ChunkStoreWriter:
+    """Stream (id, text) pairs in increasing id order into a new chunk store.
+
+    Everything is written under .tmp names; commit() renames them into place.
+    """
+
+    def __init__(self, directory, prefix="chunks"):
+        self.paths = store_paths(directory, prefix)
+        self._blob = open(self.paths[0] + ".tmp", "wb")
+        self._ids = array("q")
+        self._offsets = array("q", [0])
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, chunk_id, text):
+        if self._ids and chunk_id <= self._ids[-1]:
+            raise ValueError(f"Chunk ids must be written in increasing order ({chunk_id} after {self._ids[-1]})")
+        data = text if isinstance(text, bytes) else text.encode("utf-8")
+        self._blob.write(data)
+        self._ids.append(chunk_id)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def add_many(self, ids, texts):
+        for chunk_id, text in zip(ids, texts):
+            self.add(chunk_id, text)
+
+    def commit(self):
+        self._blob.close()
+        for path, values in ((self.paths[1], self._ids), (self.paths[2], self._offsets)):
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, np.frombuffer(values, dtype=np.int64))
+        for path in self.paths:
+            os.replace(path + ".tmp", path)
+
+    def abort(self):
+        self._blob.close()
+        for path in self.paths:
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+
+
+def migrate_pickle(pkl_path, directory, prefix="chunks"):
+    """Convert a legacy chunks.pkl (list or id-keyed dict) into a chunk store."""
+    with open(pkl_path, "rb") as f:
+        chunks = pickle.load(f)
+    items = sorted(chunks.items()) if isinstance(chunks, dict) else enumerate(chunks)
+
+    writer = ChunkStoreWriter(directory, prefix)
+    for chunk_id, text in items:
+        writer.add(chunk_id, text)
+    writer.commit()
+    os.replace(pkl_path, pkl_path + ".migrated")
+    print(f"📦 Migrated {len(writer)} chunks from {os.path.basename(pkl_path)} to the mmapped chunk store.")
+    return len(writer)
@@ -0,0 +1,121 @@
+import math
+from collections import namedtuple
+
+from lexical_index import tokenize
+from metrics import REGISTRY
+
+DEFAULT_MAX_TOKENS = 1500
+DEFAULT_MMR_LAMBDA = 0.7
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+DEFAULT_CHARS_PER_TOKEN = 4  # Rough for English with Llama/Mistral tokenizers; Ollama reports the real count after
+# Chunk overlaps come from the splitter's chunk_overlap (100 chars), cut at word boundaries
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 400
+
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "rag_context_tokens", "Estimated tokens of RAG context sent per request.", ["model"],
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192))
+CONTEXT_TOKENS_SAVED = REGISTRY.counter(
+    "rag_context_tokens_saved_total", "Estimated prompt tokens removed by de-duplication and the budget.", ["model"])
+
+AssembledContext = namedtuple("AssembledContext", [
+    "text", "chunks", "tokens", "naive_tokens", "duplicates", "trimmed_chars", "over_budget"])
+
+
+def similarity(a, b):
+    """Jaccard similarity of two term sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def overlap(before, after):
+    """Length of the longest suffix of before that after starts with (0 below MIN_OVERLAP_CHARS)."""
+    for length in range(min(len(before), len(after), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if before.endswith(after[:length]):
+            return length
+    return 0
+
+
+class ContextAssembler:
+    """Packs retrieved chunks into a per-model token budget for the system message.
+
+    Candidates come as ranked lists (the attached file's chunks, the index's hits).
+    Chunks are picked by maximal marginal relevance, trading rank against term
+    overlap with what is already picked, so near-repeats lose to new material.
+    Chunks at least duplicate_threshold similar to a picked one are dropped. Text a
+    chunk shares with a neighbouring picked chunk (the splitter's overlap) is cut.
+    Chunks that would exceed the budget are skipped, and smaller ones later in the
+    order can still fit. Similarity is lexical, so no chunk needs embedding here.
+    """
+
+    def __init__(self, max_tokens=DEFAULT_MAX_TOKENS, model_max_tokens=None, mmr_lambda=DEFAULT_MMR_LAMBDA,
+                 duplicate_threshold=DEFAULT_DUPLICATE_THRESHOLD, chars_per_token=DEFAULT_CHARS_PER_TOKEN):
+        self.max_tokens = max_tokens
+        self.model_max_tokens = model_max_tokens or {}
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.chars_per_token = chars_per_token
+
+    @classmethod
+    def from_config(cls, config):
+        settings = config.get("context", {})
+        return cls(
+            max_tokens=settings.get("max_tokens", DEFAULT_MAX_TOKENS),
+            model_max_tokens=settings.get("model_max_tokens"),
+            mmr_lambda=settings.get("mmr_lambda", DEFAULT_MMR_LAMBDA),
+            duplicate_threshold=settings.get("duplicate_threshold", DEFAULT_DUPLICATE_THRESHOLD),
+            chars_per_token=settings.get("chars_per_token", DEFAULT_CHARS_PER_TOKEN)
+        )
+
+    def budget(self, model):
+        return self.model_max_tokens.get(model, self.max_tokens)
+
+    def estimate_tokens(self, text):
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def assemble(self, rankings, model):
+        """Build the context from ranked lists of chunk texts (best first in each)."""
+        candidates = []  # (relevance, text); relevance falls linearly with rank within each list
+        for ranking in rankings:
+            ranking = [text for text in ranking if text and text.strip()]
+            candidates.extend((1 - rank / len(ranking), text) for rank, text in enumerate(ranking))
+        naive_tokens = self.estimate_tokens("\n".join(text for _, text in candidates))
+        terms = [set(tokenize(text)) for _, text in candidates]
+
+        budget = self.budget(model)
+        picked, tokens = [], 0
+        duplicates = trimmed_chars = over_budget = 0
+        redundancy = [0.0] * len(candidates)  # Max similarity to any picked chunk
+        remaining = set(range(len(candidates)))
+        while remaining:
+            best = max(remaining, key=lambda i: (self.mmr_lambda * candidates[i][0]
+                                                 - (1 - self.mmr_lambda) * redundancy[i], -i))
+            remaining.discard(best)
+            if redundancy[best] >= self.duplicate_threshold:
+                duplicates += 1
+                continue
+            text = candidates[best][1]
+            for other in picked:
+                text = text[overlap(other, text):]
+                cut = overlap(text, other)
+                text = text[:len(text) - cut] if cut else text
+            if len(text.strip()) < MIN_OVERLAP_CHARS:
+                duplicates += 1  # Nothing left beyond what is already in
+                continue
+            cost = self.estimate_tokens(text) + 1  # + the newline between chunks
+            if tokens + cost > budget:
+                over_budget += 1
+                continue
+            trimmed_chars += len(candidates[best][1]) - len(text)
+            picked.append(text)
+            tokens += cost
+            for i in remaining:
+                redundancy[i] = max(redundancy[i], similarity(terms[i], terms[best]))
+
+        text = "\n".join(chunk.strip() for chunk in picked)
+        assembled = AssembledContext(text, len(picked), self.estimate_tokens(text), naive_tokens,
+                                     duplicates, trimmed_chars, over_budget)
+        CONTEXT_TOKENS.observe(assembled.tokens, model=model)
+        CONTEXT_TOKENS_SAVED.inc(max(naive_tokens - assembled.tokens, 0), model=model)
+        return assembled
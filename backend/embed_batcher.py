@@ -0,0 +1,101 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import REGISTRY
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 2
+
+BATCH_SIZE = REGISTRY.histogram(
+    "rag_query_embedding_batch_size", "Texts per micro-batched query embedding call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent encode() calls into batched calls to encode_fn.
+
+    A single worker thread takes the first pending request, keeps collecting for up
+    to max_wait_ms or until max_batch_size texts are pending, encodes them in one
+    call (identical texts once) and hands each caller its rows. Concurrent queries
+    then share one model call instead of contending for it. Other callers of the
+    same model bypass the batcher, so encode_fn must serialize access to it.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending = queue.SimpleQueue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+
+    @classmethod
+    def from_config(cls, config, encode_fn):
+        """None unless query_batching is enabled in config.json."""
+        settings = config.get("query_batching", {})
+        if not settings.get("enabled", True):
+            return None
+        return cls(
+            encode_fn,
+            max_batch_size=settings.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE),
+            max_wait_ms=settings.get("max_wait_ms", DEFAULT_MAX_WAIT_MS)
+        )
+
+    def encode(self, texts):
+        """Same contract as encode_fn: one embedding row per text."""
+        future = Future()
+        self._pending.put((list(texts), future))
+        if self._worker is None:
+            self._start()
+        return future.result()
+
+    def _start(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="query-embedder", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._pending.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    request = self._pending.get(timeout=timeout) if timeout > 0 else self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self._encode(batch)
+
+    def _encode(self, batch):
+        unique = list(dict.fromkeys(text for texts, _ in batch for text in texts))
+        try:
+            vectors = np.asarray(self.encode_fn(unique), dtype=np.float32)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        rows = {text: i for i, text in enumerate(unique)}
+        for texts, future in batch:
+            future.set_result(vectors[[rows[text] for text in texts]])
+        self.batches += 1
+        self.texts += len(unique)
+        BATCH_SIZE.observe(len(unique))
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": round(self.texts / self.batches, 2) if self.batches else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }
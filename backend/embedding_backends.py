@@ -0,0 +1,71 @@
+import os
+import importlib.util
+
+from tracing import log
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+BACKENDS = ("fp32", "int8", "onnx")
+DEFAULT_BACKEND = "fp32"
+DEFAULT_ONNX_PATH = os.path.join(APP_DIR, "models", f"{EMBEDDING_MODEL}-onnx")
+DEFAULT_ONNX_FILE = "onnx/model.onnx"
+
+
+def embedding_settings(config):
+    """The embedding section of config.json, with defaults and relative paths resolved."""
+    settings = {"backend": DEFAULT_BACKEND, "onnx_path": DEFAULT_ONNX_PATH, "onnx_file": DEFAULT_ONNX_FILE}
+    settings.update(config.get("embedding", {}))
+    settings["onnx_path"] = os.path.join(APP_DIR, settings["onnx_path"])  # Relative to backend/
+    return settings
+
+
+def onnx_available(settings):
+    """True if the local ONNX export and the runtime to run it are both there."""
+    return (
+        os.path.exists(os.path.join(settings["onnx_path"], settings["onnx_file"]))
+        and importlib.util.find_spec("onnxruntime") is not None
+        and importlib.util.find_spec("optimum") is not None
+    )
+
+
+def resolve_backend(settings):
+    """The backend that will actually run: onnx falls back to fp32 without its export."""
+    backend = settings["backend"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    if backend == "onnx" and not onnx_available(settings):
+        log.warning(f"⚠️ No ONNX export at {settings['onnx_path']} (or onnxruntime/optimum missing); "
+                    f"embedding with fp32 instead")
+        return "fp32"
+    return backend
+
+
+def model_id(backend):
+    """Names the vectors a backend produces, for cache keys and index manifests.
+
+    fp32 keeps the bare model name, so caches and indexes built before backends
+    existed stay valid. The others differ slightly, so they never share vectors with fp32.
+    """
+    return EMBEDDING_MODEL if backend == "fp32" else f"{EMBEDDING_MODEL}@{backend}"
+
+
+def load_model(backend, settings):
+    """A SentenceTransformer-compatible model (encode(texts, batch_size=...)) for backend."""
+    from sentence_transformers import SentenceTransformer
+    if backend == "onnx":
+        return SentenceTransformer(settings["onnx_path"], device="cpu", backend="onnx",
+                                   model_kwargs={"file_name": settings["onnx_file"]})
+    model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    if backend == "int8":
+        import torch
+        # Linear layers hold nearly all of MiniLM's compute; weights become int8,
+        # activations are quantized on the fly
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def export_onnx(settings):
+    """Export the model to ONNX under settings["onnx_path"] (needs optimum[onnxruntime])."""
+    from sentence_transformers import SentenceTransformer
+    SentenceTransformer(EMBEDDING_MODEL, device="cpu", backend="onnx").save(settings["onnx_path"])
+    return settings["onnx_path"]
@@ -0,0 +1,140 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(APP_DIR, "embedding_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 500000
+
+# SQLite caps bound parameters per statement; stay well below it
+LOOKUP_BATCH = 500
+# Checking the row count is a table scan, so only do it every so many inserts
+EVICTION_CHECK_INTERVAL = 1000
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Persistent, content-addressed (model, sha256(text)) -> float32 vector cache.
+
+    Backed by SQLite in WAL mode so the indexer, the app's request threads and other
+    worker processes can share one file. When it grows past max_entries the least
+    recently used tenth is evicted.
+    """
+
+    def __init__(self, model_name, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.model_name = model_name
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._inserts_since_check = 0
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+        """)
+
+    @classmethod
+    def from_config(cls, config, model_name):
+        """Build the cache from the embedding_cache section of config.json, or None if disabled."""
+        settings = config.get("embedding_cache", {})
+        if not settings.get("enabled", True):
+            return None
+        return cls(
+            model_name,
+            path=settings.get("path", DEFAULT_CACHE_PATH),
+            max_entries=settings.get("max_entries", DEFAULT_MAX_ENTRIES)
+        )
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys that are cached, bumping their recency."""
+        found = {}
+        conn = self._conn()
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                [self.model_name, *batch]
+            ).fetchall()
+            found.update((bytes(h), np.frombuffer(v, dtype=np.float32)) for h, v in rows)
+
+        if found:
+            now = time.time()
+            conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                [(now, self.model_name, h) for h in found]
+            )
+        return found
+
+    def put_many(self, keys, vectors):
+        now = time.time()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._conn().executemany(
+            "INSERT OR REPLACE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(self.model_name, key, vector.tobytes(), now) for key, vector in zip(keys, vectors)]
+        )
+        self._inserts_since_check += len(keys)
+        if self._inserts_since_check >= EVICTION_CHECK_INTERVAL:
+            self._inserts_since_check = 0
+            self.evict()
+
+    def evict(self):
+        conn = self._conn()
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return 0
+        excess = count - int(self.max_entries * 0.9)
+        conn.execute(
+            "DELETE FROM embeddings WHERE (model, hash) IN "
+            "(SELECT model, hash FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        print(f"🧹 Evicted {excess} least recently used cached embeddings.")
+        return excess
+
+    def encode(self, texts, encode_fn):
+        """Embed texts, calling encode_fn(list_of_texts) only for those not already cached.
+
+        Duplicate texts within one call are embedded once. Returns a float32 matrix in input order.
+        """
+        keys = [text_key(t) for t in texts]
+        found = self.get_many(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - sum(1 for key in keys if key in missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            self.put_many(list(missing), vectors)
+            found.update(zip(missing, vectors))
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
@@ -0,0 +1,92 @@
+import faiss
+import numpy as np
+
+# "vector_index" section of config.json; anything missing falls back to these
+DEFAULT_INDEX_SETTINGS = {
+    "type": "flat",             # flat | ivf_flat | ivf_pq | hnsw
+    "nlist": 1024,              # IVF cells (clamped for small corpora)
+    "pq_m": 16,                 # PQ sub-quantizers; must divide the embedding dim
+    "pq_nbits": 8,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "nprobe": 16,               # search-time, applied on every load
+    "ef_search": 64,            # search-time, applied on every load
+    "max_train_points": 100000
+}
+
+# Settings that change the index structure; a difference forces a rebuild
+BUILD_KEYS = {
+    "flat": [],
+    "ivf_flat": ["nlist"],
+    "ivf_pq": ["nlist", "pq_m", "pq_nbits"],
+    "hnsw": ["hnsw_m", "ef_construction"]
+}
+
+# k-means wants ~39 points per centroid before faiss starts warning
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_settings(config):
+    settings = dict(DEFAULT_INDEX_SETTINGS)
+    settings.update(config.get("vector_index", {}))
+    if settings["type"] not in BUILD_KEYS:
+        raise ValueError(f"Unknown vector_index type: {settings['type']} (expected one of {sorted(BUILD_KEYS)})")
+    return settings
+
+def build_params(settings):
+    """The subset of settings that a built index is tied to (persisted in the manifest)."""
+    return {"type": settings["type"], **{k: settings[k] for k in BUILD_KEYS[settings["type"]]}}
+
+def needs_training(settings):
+    return settings["type"] in {"ivf_flat", "ivf_pq"}
+
+def supports_removal(settings):
+    """HNSW graphs cannot drop vectors, so deletions mean rebuilding from the vector store."""
+    return settings["type"] != "hnsw"
+
+
+def factory_string(dim, settings, n_vectors):
+    """Translate settings into a faiss.index_factory string for a corpus of n_vectors."""
+    kind = settings["type"]
+    nlist = max(1, min(settings["nlist"], n_vectors // MIN_POINTS_PER_CENTROID))
+
+    if kind == "ivf_pq":
+        if dim % settings["pq_m"] != 0:
+            raise ValueError(f"pq_m={settings['pq_m']} must divide the embedding dim {dim}")
+        if n_vectors < MIN_POINTS_PER_CENTROID * 2 ** settings["pq_nbits"]:
+            print(f"⚠️ Only {n_vectors} vectors — too few to train PQ, falling back to IVF-Flat.")
+            kind = "ivf_flat"
+        else:
+            return f"IVF{nlist},PQ{settings['pq_m']}x{settings['pq_nbits']}"
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if kind == "hnsw":
+        return f"IDMap,HNSW{settings['hnsw_m']}"
+    return "IDMap,Flat"
+
+def create_index(dim, settings, n_vectors=0):
+    """Create an empty, id-aware L2 index. IVF indexes still need train_index()."""
+    index = faiss.index_factory(dim, factory_string(dim, settings, n_vectors), faiss.METRIC_L2)
+    if settings["type"] == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = settings["ef_construction"]
+    return index
+
+def train_index(index, vectors, settings, seed=1234):
+    """Train on a random sample of at most max_train_points rows (vectors may be a memmap)."""
+    if index.is_trained:
+        return 0
+    n = len(vectors)
+    sample_size = min(n, settings["max_train_points"])
+    rows = np.sort(np.random.default_rng(seed).choice(n, size=sample_size, replace=False))
+    index.train(np.ascontiguousarray(vectors[rows], dtype=np.float32))
+    return sample_size
+
+def apply_search_params(index, settings):
+    """Set nprobe / efSearch on whichever of them the index understands."""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", settings["nprobe"]), ("efSearch", settings["ef_search"])):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # Not applicable to this index type
+    return index
@@ -0,0 +1,80 @@
+import os
+import re
+import shutil
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATIONS_DIR = os.path.join(APP_DIR, "index_generations")
+CURRENT_FILE = os.path.join(GENERATIONS_DIR, "CURRENT")
+
+# Every build writes a complete, immutable gen-NNNNNN directory; CURRENT names the live one
+GENERATION_PATTERN = re.compile(r"^gen-(\d{6})$")
+
+
+def list_generations():
+    """Completed generation names, oldest first."""
+    if not os.path.isdir(GENERATIONS_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(GENERATIONS_DIR)
+        if GENERATION_PATTERN.match(name) and not os.path.exists(os.path.join(GENERATIONS_DIR, name, ".building"))
+    )
+
+def current_generation():
+    if not os.path.exists(CURRENT_FILE):
+        return None
+    with open(CURRENT_FILE, "r") as f:
+        name = f.read().strip()
+    return name if os.path.isdir(generation_dir(name)) else None
+
+def generation_dir(name):
+    return os.path.join(GENERATIONS_DIR, name)
+
+def current_index_dir():
+    """Directory holding the live index; APP_DIR for builds that predate generations."""
+    name = current_generation()
+    return generation_dir(name) if name else APP_DIR
+
+def previous_generation(name=None):
+    """The generation before name (default: the current one), i.e. the rollback target."""
+    name = name or current_generation()
+    older = [gen for gen in list_generations() if name is None or gen < name]
+    return older[-1] if older else None
+
+
+def new_generation_dir():
+    """Reserve the next generation directory, marked as in-progress until finish_generation()."""
+    os.makedirs(GENERATIONS_DIR, exist_ok=True)
+    numbers = [int(GENERATION_PATTERN.match(name).group(1))
+               for name in os.listdir(GENERATIONS_DIR) if GENERATION_PATTERN.match(name)]
+    while True:
+        name = f"gen-{max(numbers, default=0) + 1:06d}"
+        try:
+            os.makedirs(generation_dir(name))
+            break
+        except FileExistsError:
+            numbers.append(int(name[4:]))  # Another builder got there first
+    open(os.path.join(generation_dir(name), ".building"), "w").close()
+    return generation_dir(name)
+
+def finish_generation(directory):
+    os.remove(os.path.join(directory, ".building"))
+    return os.path.basename(directory)
+
+def discard_generation(directory):
+    shutil.rmtree(directory, ignore_errors=True)
+
+def activate(name):
+    """Atomically point CURRENT at name."""
+    if name not in list_generations():
+        raise ValueError(f"Unknown index generation: {name}")
+    with open(CURRENT_FILE + ".tmp", "w") as f:
+        f.write(name)
+    os.replace(CURRENT_FILE + ".tmp", CURRENT_FILE)
+
+def prune(keep=3):
+    """Delete all but the newest `keep` generations, never touching the live one."""
+    current = current_generation()
+    for name in list_generations()[:-keep or None]:
+        if name != current:
+            discard_generation(generation_dir(name))
+            print(f"🧹 Pruned index generation {name}.")
@@ -0,0 +1,66 @@
+import time
+import threading
+
+from tracing import log
+
+
+class Lazy:
+    """A heavy component built on first use (or by warm_up()), exactly once.
+
+    get() blocks callers that arrive while another thread is still building it. A
+    failed build is remembered for status() and retried on the next get().
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.state = "pending"  # pending -> loading -> ready | failed
+        self.error = None
+        self.load_seconds = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def get(self):
+        if self.state == "ready":
+            return self._value
+        with self._lock:
+            if self.state != "ready":
+                self.state = "loading"
+                started = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                except Exception as e:
+                    self.state, self.error = "failed", str(e)
+                    raise
+                self.load_seconds = time.perf_counter() - started
+                self.error = None
+                self.state = "ready"
+        return self._value
+
+    def status(self):
+        status = {"state": self.state}
+        if self.load_seconds is not None:
+            status["load_seconds"] = round(self.load_seconds, 3)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+def warm_up(components):
+    """Build every component in a background thread, so the first requests don't pay for it."""
+    def run():
+        started = time.perf_counter()
+        for component in components:
+            try:
+                component.get()
+            except Exception as e:
+                log.warning(f"⚠️ Warm-up of {component.name} failed: {e}")
+        print(f"🔥 Warm-up finished in {time.perf_counter() - started:.1f}s")
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
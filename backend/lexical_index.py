@@ -0,0 +1,180 @@
+import os
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# Words and numbers; joined forms such as "ab-1234", "v2.1" or "error_code" are one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+JOINERS = re.compile(r"[-_./]")
+STOP_WORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+DEFAULT_MODE = "hybrid"
+MODES = ("dense", "lexical", "hybrid")
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+DEFAULT_RRF_K = 60
+# Above 1/16th of the corpus in matched postings, scores are summed into a per-chunk array
+DENSE_ACCUMULATOR_RATIO = 16
+
+# Files in an index directory, next to the FAISS index and the chunk store
+VOCAB_FILE = "bm25_vocab.txt"
+ARRAY_FILES = ("ids", "doc_lengths", "offsets", "postings", "tfs")
+
+
+def retrieval_settings(config):
+    """The retrieval section of config.json, with defaults."""
+    settings = {
+        "mode": DEFAULT_MODE,
+        "top_k": 3,
+        "candidates": 20,  # Per retriever, before fusion
+        "rrf_k": DEFAULT_RRF_K,
+        "bm25_k1": DEFAULT_K1,
+        "bm25_b": DEFAULT_B
+    }
+    settings.update(config.get("retrieval", {}))
+    if settings["mode"] not in MODES:
+        raise ValueError(f"Unknown retrieval mode {settings['mode']!r}; expected one of {', '.join(MODES)}")
+    return settings
+
+
+def tokenize(text):
+    """Lowercased terms, minus a few stop words. Joined forms are also split into their
+    parts, so "AB-1234" is found by "ab-1234", "AB 1234" and "1234" alike."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOP_WORDS:
+            continue
+        terms.append(token)
+        if JOINERS.search(token):
+            terms.extend(part for part in JOINERS.split(token) if part not in STOP_WORDS)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings, k=DEFAULT_RRF_K):
+    """Merge ranked id lists: each id scores sum(1 / (k + rank)). Best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _path(directory, name):
+    return os.path.join(directory, f"bm25_{name}.npy")
+
+
+class LexicalIndex:
+    """BM25 over the chunk store, as a term -> (chunk, term frequency) inverted index.
+
+    Postings are stored CSR-style: term t's chunks are postings[offsets[t]:offsets[t+1]],
+    as positions into ids. Everything but the vocabulary is mmapped on load, and a
+    query only touches the postings of its own terms. k1 and b are applied at query
+    time, so they can be tuned without a rebuild.
+    """
+
+    def __init__(self, vocab, ids, doc_lengths, offsets, postings, tfs):
+        self.vocab = vocab  # term -> term id
+        self.ids = ids  # position -> chunk id
+        self.doc_lengths = doc_lengths
+        self.offsets = offsets
+        self.postings = postings
+        self.tfs = tfs
+        self.avgdl = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, VOCAB_FILE)) and all(
+            os.path.exists(_path(directory, name)) for name in ARRAY_FILES)
+
+    @classmethod
+    def build(cls, items):
+        """Index (chunk id, text) pairs, streaming: only the postings are held in memory."""
+        vocab = {}
+        ids, doc_lengths = array("q"), array("i")
+        term_ids, postings, tfs = array("i"), array("i"), array("H")
+        for position, (chunk_id, text) in enumerate(items):
+            counts = Counter(tokenize(text))
+            ids.append(chunk_id)
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                postings.append(position)
+                tfs.append(min(tf, 65535))
+
+        term_ids = np.frombuffer(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")  # Groups postings by term, chunks ascending
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=offsets[1:])
+        return cls(
+            vocab,
+            np.frombuffer(ids, dtype=np.int64),
+            np.frombuffer(doc_lengths, dtype=np.int32),
+            offsets,
+            np.frombuffer(postings, dtype=np.int32)[order],
+            np.frombuffer(tfs, dtype=np.uint16)[order]
+        )
+
+    def save(self, directory):
+        """Write via temp files, then rename, so a reader never sees a partial index."""
+        vocab_path = os.path.join(directory, VOCAB_FILE)
+        with open(vocab_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(sorted(self.vocab, key=self.vocab.get)))
+        for name in ARRAY_FILES:
+            with open(_path(directory, name) + ".tmp", "wb") as f:
+                np.save(f, getattr(self, name))
+        for path in [vocab_path] + [_path(directory, name) for name in ARRAY_FILES]:
+            os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, directory):
+        """The lexical index in directory, or None if it has none (built before BM25 existed)."""
+        if not cls.exists(directory):
+            return None
+        with open(os.path.join(directory, VOCAB_FILE), encoding="utf-8") as f:
+            terms = f.read().split("\n")
+        vocab = {term: i for i, term in enumerate(terms) if term}
+        arrays = {name: np.load(_path(directory, name), mmap_mode="r") for name in ARRAY_FILES}
+        return cls(vocab, **arrays)
+
+    def search(self, query, k, k1=DEFAULT_K1, b=DEFAULT_B):
+        """The k best chunks for query as (scores, chunk ids), best first. Chunks
+        sharing no term with the query are never returned, so there may be fewer."""
+        term_ids = [self.vocab[term] for term in set(tokenize(query)) if term in self.vocab]
+        if not term_ids or not len(self.ids):
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        n = len(self.ids)
+        matched, weights = [], []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = k1 * (1 - b + b * self.doc_lengths[docs] / self.avgdl)
+            matched.append(docs)
+            weights.append(idf * tf * (k1 + 1) / (tf + norm))
+
+        matched, weights = np.concatenate(matched), np.concatenate(weights)
+        if len(matched) * DENSE_ACCUMULATOR_RATIO > n:
+            # Common terms: one pass into a per-chunk array beats sorting the postings
+            scores = np.bincount(matched, weights=weights, minlength=n)
+            docs = np.flatnonzero(scores)
+            scores = scores[docs]
+        else:
+            # Rare terms: sum over the matched postings only, never over the whole corpus
+            docs, inverse = np.unique(matched, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        else:
+            top = np.argsort(-scores)
+        return scores[top].astype(np.float32), np.asarray(self.ids[docs[top]], dtype=np.int64)
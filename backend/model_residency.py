@@ -0,0 +1,190 @@
+import time
+import threading
+from collections import OrderedDict
+
+from metrics import REGISTRY
+from tracing import log
+
+DEFAULT_KEEP_ALIVE = "30m"
+DEFAULT_COLD_LOAD_MS = 1000  # Ollama's load_duration above this means the model was loaded for the request
+DEFAULT_SYNC_INTERVAL_SECONDS = 30
+
+TTFT_BY_RESIDENCY_SECONDS = REGISTRY.histogram(
+    "rag_ttft_by_residency_seconds", "Time to first token, split by whether the model was already loaded.",
+    ["model", "residency"])
+MODEL_LOADS = REGISTRY.counter("rag_model_loads_total", "Model loads by cause (preload or cold request).", ["model", "cause"])
+MODEL_EVICTIONS = REGISTRY.counter("rag_model_evictions_total", "Models unloaded to stay within the memory budget.",
+                                   ["model"])
+
+
+def _base_name(name):
+    """Ollama reports "llama3:latest"; config.json says "llama3"."""
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
+
+class ModelResidency:
+    """Which models Ollama has loaded, and keeping the useful ones there.
+
+    Every Ollama request passes keep_alive(model), so each model stays loaded for
+    its configured time (-1 pins it). With a memory budget, prepare() unloads the
+    least recently used idle, unpinned models before a cold model is loaded. The
+    resident set is re-read from Ollama's /api/ps every sync_interval_seconds, so
+    loads and expiries Ollama does on its own are picked up. record() classifies each
+    generation as warm or cold from Ollama's load_duration and keeps TTFT apart.
+    """
+
+    def __init__(self, get_client, keep_alive=DEFAULT_KEEP_ALIVE, model_keep_alive=None, memory_budget_mb=0,
+                 model_memory_mb=None, cold_load_ms=DEFAULT_COLD_LOAD_MS,
+                 sync_interval_seconds=DEFAULT_SYNC_INTERVAL_SECONDS, is_busy=None):
+        self.get_client = get_client  # Called per use, so the Ollama client can be created lazily
+        self.default_keep_alive = keep_alive
+        self.model_keep_alive = model_keep_alive or {}
+        self.memory_budget_mb = memory_budget_mb
+        self.model_memory_mb = model_memory_mb or {}
+        self.cold_load_ms = cold_load_ms
+        self.sync_interval = sync_interval_seconds
+        self.is_busy = is_busy or (lambda model: False)  # Never evict a model with requests running
+        self._resident = OrderedDict()  # model -> size in MB, least recently used first
+        self._sizes = {}  # On-disk size from /api/tags, the estimate for models not loaded yet
+        self._synced_at = 0.0
+        self._ttft = {}  # model -> {"warm"|"cold": [count, total_ms]}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.preloaded = []
+
+    @classmethod
+    def from_config(cls, config, get_client, is_busy=None):
+        settings = config.get("model_residency", {})
+        return cls(
+            get_client,
+            keep_alive=settings.get("keep_alive", DEFAULT_KEEP_ALIVE),
+            model_keep_alive=settings.get("model_keep_alive"),
+            memory_budget_mb=settings.get("memory_budget_mb", 0),
+            model_memory_mb=settings.get("model_memory_mb"),
+            cold_load_ms=settings.get("cold_load_ms", DEFAULT_COLD_LOAD_MS),
+            sync_interval_seconds=settings.get("sync_interval_seconds", DEFAULT_SYNC_INTERVAL_SECONDS),
+            is_busy=is_busy
+        )
+
+    def keep_alive(self, model):
+        return self.model_keep_alive.get(model, self.default_keep_alive)
+
+    def pinned(self, model):
+        """A negative keep_alive keeps the model loaded indefinitely, so it is never evicted."""
+        return str(self.keep_alive(model)).startswith("-")
+
+    def sync(self):
+        """Refresh the resident set (and size estimates) from Ollama."""
+        self._synced_at = time.monotonic()  # Also after a failure, so an unreachable Ollama is retried per interval
+        try:
+            running = self.get_client().ps().models
+            if not self._sizes:
+                self._sizes = {_base_name(m.model): m.size / 2**20 for m in self.get_client().list().models if m.size}
+        except Exception as e:
+            log.warning(f"⚠️ Could not read loaded models from Ollama: {e}")
+            return
+        with self._lock:
+            loaded = {_base_name(m.model): (m.size or 0) / 2**20 for m in running}
+            # Keep our recency order for models still loaded; new ones count as least recent
+            order = [model for model in self._resident if model in loaded]
+            order = [model for model in loaded if model not in self._resident] + order
+            self._resident = OrderedDict((model, loaded[model]) for model in order)
+
+    def size_mb(self, model):
+        if model in self.model_memory_mb:
+            return self.model_memory_mb[model]
+        return self._resident.get(model) or self._sizes.get(model, 0)
+
+    def prepare(self, model):
+        """Call before a request to model: marks it used and, if it is about to be
+        loaded, unloads least recently used idle models until it fits the budget."""
+        if time.monotonic() - self._synced_at > self.sync_interval:
+            self.sync()
+        with self._lock:
+            if model in self._resident:
+                self._resident.move_to_end(model)
+                return
+            victims = self._victims(model)
+        for victim in victims:
+            self.unload(victim)
+
+    def _victims(self, model):
+        if not self.memory_budget_mb:
+            return []
+        needed = self.size_mb(model)
+        used = sum(self.size_mb(name) for name in self._resident)
+        victims = []
+        for name in self._resident:
+            if used + needed <= self.memory_budget_mb:
+                break
+            if self.pinned(name) or self.is_busy(name):
+                continue
+            victims.append(name)
+            used -= self.size_mb(name)
+        return victims
+
+    def unload(self, model):
+        try:
+            self.get_client().generate(model=model, keep_alive=0)  # An empty request with keep_alive 0 unloads
+        except Exception as e:
+            log.warning(f"⚠️ Could not unload {model}: {e}")
+            return
+        with self._lock:
+            self._resident.pop(model, None)
+            self.evictions += 1
+        MODEL_EVICTIONS.inc(model=model)
+        log.info("📤 Unloaded %s to stay within the %s MB model budget", model, self.memory_budget_mb)
+
+    def preload(self, models):
+        """Load models ahead of the first request (an empty generate loads without generating)."""
+        for model in dict.fromkeys(m for m in models if m):
+            self.prepare(model)
+            started = time.perf_counter()
+            try:
+                self.get_client().generate(model=model, keep_alive=self.keep_alive(model))
+            except Exception as e:
+                log.warning(f"⚠️ Could not preload {model}: {e}")
+                continue
+            self._loaded(model)
+            self.preloaded.append(model)
+            MODEL_LOADS.inc(model=model, cause="preload")
+            print(f"🔥 Preloaded {model} in {time.perf_counter() - started:.1f}s")
+        self.sync()
+
+    def _loaded(self, model):
+        with self._lock:
+            self._resident[model] = self.size_mb(model)
+            self._resident.move_to_end(model)
+
+    def record(self, model, ttft_ms, metrics):
+        """Classify a finished generation as warm or cold; returns which."""
+        cold = (metrics.get("load_duration_ms") or 0) >= self.cold_load_ms
+        residency = "cold" if cold else "warm"
+        self._loaded(model)
+        if cold:
+            MODEL_LOADS.inc(model=model, cause="request")
+        if ttft_ms is not None:
+            TTFT_BY_RESIDENCY_SECONDS.observe(ttft_ms / 1000, model=model, residency=residency)
+            with self._lock:
+                totals = self._ttft.setdefault(model, {}).setdefault(residency, [0, 0.0])
+                totals[0] += 1
+                totals[1] += ttft_ms
+        return residency
+
+    def stats(self):
+        with self._lock:
+            resident = [{"model": model, "size_mb": round(self.size_mb(model), 1), "keep_alive": self.keep_alive(model)}
+                        for model in reversed(self._resident)]  # Most recently used first
+            ttft = {
+                model: {residency: {"count": count, "mean_ttft_ms": round(total / count, 2)}
+                        for residency, (count, total) in by_residency.items()}
+                for model, by_residency in self._ttft.items()
+            }
+        return {
+            "resident": resident,
+            "resident_mb": round(sum(entry["size_mb"] for entry in resident), 1),
+            "memory_budget_mb": self.memory_budget_mb,
+            "preloaded": self.preloaded,
+            "evictions": self.evictions,
+            "ttft": ttft
+        }
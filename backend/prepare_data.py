@@ -1,28 +1,67 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
 import fitz  # PyMuPDF
 import os
+import sys
+import time
+import threading
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import shutil
 import faiss
 import numpy as np
-import pickle
 from docx import Document
 from pptx import Presentation
 import pandas as pd
+from vector_store import VectorStore
+from chunk_store import ChunkStore, ChunkStoreWriter, store_exists, migrate_pickle
+from index_factory import index_settings, build_params, needs_training, supports_removal, create_index, train_index
+import index_generations
+from embedding_cache import EmbeddingCache
+from lexical_index import LexicalIndex
+from embedding_backends import embedding_settings, resolve_backend, model_id, load_model
 
-UPLOAD_FOLDER_FILES = "uploads/files"
-UPLOAD_FOLDER_RAG = "uploads/rag"
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.abspath(os.path.join(APP_DIR, ".."))
+UPLOAD_ROOT = os.path.join(BASE_DIR, "uploads")
+UPLOAD_FOLDER_FILES = os.path.join(UPLOAD_ROOT, "files")
+UPLOAD_FOLDER_RAG = os.path.join(UPLOAD_ROOT, "rag")
 ALLOWED_EXTENSIONS = {'.pdf', '.txt', '.docx', '.pptx', '.xls', '.xlsx'}
 
+# File names inside an index directory (an index generation, or APP_DIR for older builds)
+INDEX_FILE = "vector_index.faiss"
+LEGACY_CHUNKS_FILE = "chunks.pkl"
+MANIFEST_FILE = "index_manifest.json"
+CONFIG_FILE = os.path.join(BASE_DIR, "config.json")
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+MANIFEST_VERSION = 1
+DEFAULT_EMBEDDING_BATCH_SIZE = 64
+IVF_RETRAIN_GROWTH = 4
+DEFAULT_GENERATIONS_TO_KEEP = 3
+# With --progress-json, lines starting with this carry JSON progress / the result for the app
+PROGRESS_MARKER = "@@progress "
+
+def load_config():
+    """Load settings from config.json"""
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, "r") as f:
+            return json.load(f)
+    return {}
+
 def extract_text_from_pdf(filepath):
-    text = ""
+    pages = []
     try:
         doc = fitz.open(filepath)
         for page in doc:
-            text += page.get_text()
+            pages.append(page.get_text())
         doc.close()
     except Exception as e:
         print(f"❌ Failed to extract PDF: {filepath} — {e}")
-    return text
+    return "".join(pages)
 
 def extract_text_from_docx(filepath):
     try:
@@ -33,93 +72,493 @@ def extract_text_from_docx(filepath):
         return ""
 
 def extract_text_from_pptx(filepath):
-    text = ""
+    parts = []
     try:
         prs = Presentation(filepath)
         for slide in prs.slides:
             for shape in slide.shapes:
                 if hasattr(shape, "text"):
-                    text += shape.text + "\n"
+                    parts.append(shape.text + "\n")
     except Exception as e:
         print(f"❌ Failed to extract PPTX: {filepath} — {e}")
-    return text
+    return "".join(parts)
 
 def extract_text_from_excel(filepath):
-    text = ""
+    parts = []
     try:
         # Try all sheets, all cells
         excel_data = pd.read_excel(filepath, sheet_name=None, engine='openpyxl' if filepath.endswith('.xlsx') else 'xlrd')
         for sheet_name, sheet_df in excel_data.items():
-            text += f"Sheet: {sheet_name}\n"
-            text += sheet_df.fillna("").astype(str).to_string(index=False, header=False)
-            text += "\n\n"
+            parts.append(f"Sheet: {sheet_name}\n")
+            parts.append(sheet_df.fillna("").astype(str).to_string(index=False, header=False))
+            parts.append("\n\n")
     except Exception as e:
         print(f"❌ Failed to extract Excel: {filepath} — {e}")
-    return text
+    return "".join(parts)
+
+def extract_text(filepath):
+    """Extract the text of a single file, dispatching on its extension."""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == ".pdf":
+        return extract_text_from_pdf(filepath)
+    elif ext == ".txt":
+        with open(filepath, "r", encoding="utf-8") as f:
+            return f.read()
+    elif ext == ".docx":
+        return extract_text_from_docx(filepath)
+    elif ext == ".pptx":
+        return extract_text_from_pptx(filepath)
+    elif ext in {".xls", ".xlsx"}:
+        return extract_text_from_excel(filepath)
+    return ""
+
+def scan_source_files():
+    """Return {key: path} for every indexable file, keyed by its path relative to uploads/."""
+    sources = {}
+    for folder in (UPLOAD_FOLDER_FILES, UPLOAD_FOLDER_RAG):
+        if not os.path.exists(folder):
+            print(f"⚠️ Folder does not exist: {folder}")
+            continue
+
+        for filename in sorted(os.listdir(folder)):
+            filepath = os.path.join(folder, filename)
+            ext = os.path.splitext(filename)[1].lower()
+            if not os.path.isfile(filepath) or ext not in ALLOWED_EXTENSIONS:
+                continue
+            key = os.path.relpath(filepath, UPLOAD_ROOT).replace(os.sep, "/")
+            sources[key] = filepath
+
+    return sources
+
+def file_sha256(filepath):
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def extract_file(key, filepath):
+    """Pool worker: extract one file, never raising so a bad file can't take down the pool."""
+    print(f"🔍 Processing {key}")
+    try:
+        return key, extract_text(filepath)
+    except Exception as e:
+        print(f"⚠️ Failed to process {key}: {e}")
+        return key, ""
+
+def iter_extracted_texts(sources, workers=None):
+    """Yield (key, text) for each {key: path} entry as soon as its extraction finishes."""
+    workers = min(workers or os.cpu_count() or 1, len(sources))
+    if workers > 1 and threading.active_count() > 1:
+        # Forking a threaded process (e.g. the web app, with its model, SQLite connections and
+        # scheduler threads) can deadlock the children; the app runs rebuilds as this CLI instead
+        print("⚠️ Called from a multithreaded process — extracting in-process instead of forking.")
+        workers = 1
+    if workers <= 1:
+        for key, filepath in sources.items():
+            yield extract_file(key, filepath)
+        return
+
+    # On Linux, fork so workers skip re-importing langchain and the parsers. Only reached
+    # from a single-threaded process (the CLI), and everything is submitted up front, so
+    # every worker exists before the parent loads the model.
+    ctx = multiprocessing.get_context("fork") if sys.platform.startswith("linux") else None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = [pool.submit(extract_file, key, filepath) for key, filepath in sources.items()]
+        for future in as_completed(futures):
+            yield future.result()
+
 
-def collect_text_from_folder(folder):
-    combined_text = ""
-    processed_files = []
+def new_manifest(model):
+    return {
+        "version": MANIFEST_VERSION,
+        "model": model,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "next_id": 0,
+        "files": {}
+    }
 
-    if not os.path.exists(folder):
-        print(f"⚠️ Folder does not exist: {folder}")
-        return combined_text, processed_files
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, ValueError) as e:
+        print(f"⚠️ Failed to load manifest — {e}")
+        return None
+
+def manifest_is_compatible(manifest, model):
+    """A manifest can be reused only if it was built with the same model (and backend) and chunking."""
+    return (
+        manifest is not None
+        and manifest.get("version") == MANIFEST_VERSION
+        and manifest.get("model") == model
+        and manifest.get("chunk_size") == CHUNK_SIZE
+        and manifest.get("chunk_overlap") == CHUNK_OVERLAP
+    )
+
+def load_existing_index(directory):
+    """Load the id-aware index and mmapped chunk store from a previous build."""
+    legacy_chunks = os.path.join(directory, LEGACY_CHUNKS_FILE)
+    if not store_exists(directory) and os.path.exists(legacy_chunks):
+        migrate_pickle(legacy_chunks, directory)
+    index_path = os.path.join(directory, INDEX_FILE)
+    if not (os.path.exists(index_path) and store_exists(directory)):
+        return None, None
+    try:
+        return faiss.read_index(index_path), ChunkStore(directory)
+    except Exception as e:
+        print(f"⚠️ Could not load existing index — {e}")
+        return None, None
+
+def live_chunk_ids(manifest):
+    return [chunk_id for entry in manifest["files"].values() for chunk_id in entry["chunk_ids"]]
+
+def plan_changes(manifest, sources):
+    """Return ({key: sha256} of added/changed files, [removed keys]), refreshing stat info of untouched files."""
+    known = manifest["files"]
+    changed = {}
+
+    for key, filepath in sources.items():
+        st = os.stat(filepath)
+        entry = known.get(key)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            continue  # Fast path: stat unchanged, skip hashing
 
-    for filename in os.listdir(folder):
-        filepath = os.path.join(folder, filename)
-        ext = os.path.splitext(filename)[1].lower()
-        if not os.path.isfile(filepath) or ext not in ALLOWED_EXTENSIONS:
+        digest = file_sha256(filepath)
+        if entry and entry["sha256"] == digest:
+            # Touched but identical content — just refresh the stat info
+            entry["size"] = st.st_size
+            entry["mtime"] = st.st_mtime
             continue
+        changed[key] = digest
+
+    removed = [key for key in known if key not in sources]
+    return changed, removed
+
+def write_outputs(directory, index, chunk_writer, manifest):
+    """Write index, chunk store and manifest via temp files so readers never see a partial write."""
+    index_path = os.path.join(directory, INDEX_FILE)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    faiss.write_index(index, index_path + ".tmp")
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(index_path + ".tmp", index_path)
+    chunk_writer.commit()
+    write_lexical_index(directory)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+def write_lexical_index(directory):
+    """BM25 over the committed chunk store. Rebuilt in full every time: tokenizing is
+    cheap next to embedding, and it keeps term statistics exact."""
+    started = time.perf_counter()
+    chunks = ChunkStore(directory)
+    lexical = LexicalIndex.build(chunks.items())
+    chunks.close()
+    lexical.save(directory)
+    print(f"🔤 Built BM25 index: {len(lexical.vocab)} terms over {len(lexical)} chunks "
+          f"in {time.perf_counter() - started:.1f}s.")
+
+
+class EmbeddingStage:
+    """Embed chunks batch_size at a time, streaming each batch to the vector file and FAISS.
+
+    Only one batch of texts and vectors is ever held in memory, so peak usage does not
+    grow with the corpus. Texts already in the embedding cache are not re-embedded, and
+    the model is only loaded once a batch has a cache miss. A missing index is created on
+    the first batch, unless it needs training or store_only is set (the index is being
+    rebuilt and must also get the unchanged files' stored vectors), in which case vectors
+    only go to the store and index_from_store() builds the index afterwards.
+    """
 
-        print(f"🔍 Processing {filename}")
-        processed_files.append(filename)
+    def __init__(self, index, store, batch_size, settings, model=None, progress=None, cache=None, load_model=None,
+                 store_only=False):
+        self.index = index
+        self.store_only = store_only
+        self.store = store
+        self.batch_size = batch_size
+        self.settings = settings
+        self.model = model
+        self.load_model = load_model  # Builds the model on the first cache miss, if none was given
+        self.progress = progress
+        self.cache = cache
+        self.pending_ids = []
+        self.pending_texts = []
+        self.embedded = 0
 
-        try:
-            if ext == ".pdf":
-                combined_text += extract_text_from_pdf(filepath) + "\n"
-            elif ext == ".txt":
-                with open(filepath, "r", encoding="utf-8") as f:
-                    combined_text += f.read() + "\n"
-            elif ext == ".docx":
-                combined_text += extract_text_from_docx(filepath) + "\n"
-            elif ext == ".pptx":
-                combined_text += extract_text_from_pptx(filepath) + "\n"
-            elif ext in {".xls", ".xlsx"}:
-                combined_text += extract_text_from_excel(filepath) + "\n"
-        except Exception as e:
-            print(f"⚠️ Failed to process {filename}: {e}")
+    def add(self, ids, texts):
+        self.pending_ids.extend(ids)
+        self.pending_texts.extend(texts)
+        while len(self.pending_texts) >= self.batch_size:
+            self._encode(self.batch_size)
 
-    return combined_text, processed_files
+    def flush(self):
+        while self.pending_texts:
+            self._encode(self.batch_size)
+        return self.index
 
+    def _encode(self, n):
+        ids, texts = self.pending_ids[:n], self.pending_texts[:n]
+        del self.pending_ids[:n], self.pending_texts[:n]
 
-# Aggregate all RAG-eligible content
-text1, files1 = collect_text_from_folder(UPLOAD_FOLDER_FILES)
-text2, files2 = collect_text_from_folder(UPLOAD_FOLDER_RAG)
-all_text = text1 + text2
-all_files = files1 + files2
+        if self.cache is not None:
+            vectors = self.cache.encode(texts, self._embed)
+        else:
+            vectors = self._embed(texts)
+        self.store.dim = vectors.shape[1]
+        if self.index is None and not self.store_only and not needs_training(self.settings):
+            self.index = create_index(vectors.shape[1], self.settings)
 
-print(f"📄 Indexed {len(all_files)} files: {all_files}")
+        ids = np.array(ids, dtype="int64")
+        self.store.append(ids, vectors)
+        if self.index is not None:
+            self.index.add_with_ids(vectors, ids)
+        self.embedded += len(ids)
+        print(f"🧠 Embedded {self.embedded} chunks so far...")
+        if self.progress:
+            self.progress("embedding", chunks_embedded=self.embedded)
 
-print(f"🗂️ Found {len(all_text.split())} words of raw text.")
+    def _embed(self, texts):
+        if self.model is None:
+            self.model = self.load_model()
+        return np.asarray(self.model.encode(texts, batch_size=self.batch_size), dtype="float32")
 
-# Chunk and embed
-splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-chunks = splitter.split_text(all_text)
 
-print(f"🧩 Split into {len(chunks)} chunks.")
+def store_covers(store, live_ids):
+    """True if every live chunk has its vector in the store (older builds may predate it)."""
+    ids, _ = store.open()
+    return bool(np.isin(np.fromiter(live_ids, dtype=np.int64), ids).all())
 
-if not chunks:
-    print("❌ No valid chunks to embed. Exiting.")
-    exit(1)
+def index_from_store(store, live_ids, settings):
+    """Build a fresh index from the stored vectors of live chunks, training it first if needed."""
+    store.compact(live_ids)
+    ids, vectors = store.open()
+    index = create_index(store.dim, settings, len(ids))
+    trained_on = train_index(index, vectors, settings)
+    for batch_ids, batch_vectors in store.iter_batches(65536):
+        index.add_with_ids(batch_vectors, batch_ids)
+    print(f"🏗️ Built {settings['type']} index from {index.ntotal} stored vectors"
+          + (f" (trained on {trained_on})." if trained_on else "."))
+    return index, trained_on
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
-embeddings = model.encode(chunks)
 
-index = faiss.IndexFlatL2(embeddings[0].shape[0])
-index.add(np.array(embeddings))
+def build_index(source_dir, out_dir, full=False, workers=None, batch_size=None, model=None, progress=None,
+                backend=None):
+    """Build an index for the current uploads/ into out_dir, reusing what source_dir already has.
+
+    source_dir and out_dir may be the same directory. Returns the number of live chunks,
+    or 0 if there is nothing to index. If nothing changed, out_dir is left empty.
+    progress, if given, is called as progress(stage, **counts) while the build runs.
+    A model passed in must be the given embedding backend's (default: embedding.backend
+    in config.json).
+    """
+    progress = progress or (lambda stage, **counts: None)
+    progress("scanning")
+    sources = scan_source_files()
+    print(f"📄 Found {len(sources)} indexable files: {list(sources)}")
+
+    config = load_config()
+    settings = index_settings(config)
+    embedding = embedding_settings(config)
+    backend = backend or resolve_backend(embedding)
+    vectors_model = model_id(backend)
+    print(f"🧠 Embedding with the {backend} backend.")
+    manifest = None if full else load_manifest(source_dir)
+    index, old_chunks = (None, None) if full else load_existing_index(source_dir)
+
+    if not manifest_is_compatible(manifest, vectors_model) or index is None:
+        if not full:
+            print("🔁 No reusable manifest/index found — doing a full rebuild.")
+        manifest = new_manifest(vectors_model)
+        index = None
+
+    store = VectorStore(out_dir, manifest.get("dim"))
+    if not manifest["files"]:
+        store.reset()
+    elif out_dir != source_dir:
+        # The new build appends to its own copy; the source generation stays untouched
+        for path in (store.vectors_path, store.ids_path):
+            src = os.path.join(source_dir, os.path.basename(path))
+            if os.path.exists(src):
+                shutil.copyfile(src, path)
+
+    changed, removed = plan_changes(manifest, sources)
+    print(f"🧮 {len(changed)} added/changed, {len(removed)} removed, "
+          f"{len(sources) - len(changed)} unchanged.")
+
+    # Some updates can't be applied to the existing index in place
+    rebuild_reason = None
+    if index is not None:
+        if manifest.get("index") != build_params(settings):
+            rebuild_reason = "vector_index settings changed"
+        elif not supports_removal(settings) and (removed or any(key in manifest["files"] for key in changed)):
+            rebuild_reason = f"{settings['type']} index cannot delete vectors"
+    if rebuild_reason:
+        print(f"🔁 Rebuilding index from stored vectors: {rebuild_reason}.")
+        index = None
+        if not store_covers(store, live_chunk_ids(manifest)):
+            print("⚠️ Vector store is incomplete — re-embedding everything.")
+            manifest = new_manifest(vectors_model)
+            store.reset()
+            changed, removed = plan_changes(manifest, sources)
+
+    if not changed and not removed and index is not None and not LexicalIndex.exists(source_dir):
+        print("🔤 Index has no BM25 index yet — writing a generation with one.")
+    elif not changed and not removed and index is not None:
+        if out_dir == source_dir:
+            # Building in place: keep refreshed stat info so touched files aren't re-hashed
+            manifest_path = os.path.join(source_dir, MANIFEST_FILE)
+            with open(manifest_path + ".tmp", "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(manifest_path + ".tmp", manifest_path)
+        else:
+            # source_dir is a published generation and is never modified; touched
+            # files are re-hashed until the next build that writes a generation
+            store.reset()
+        print("✅ Index already up to date.")
+        return len(old_chunks)
+
+    # Drop vectors of deleted files and of files whose content changed
+    stale_ids = []
+    for key in removed + list(changed):
+        entry = manifest["files"].pop(key, None)
+        if entry:
+            stale_ids.extend(entry["chunk_ids"])
+    if stale_ids and index is not None:
+        index.remove_ids(np.array(stale_ids, dtype="int64"))
+        print(f"🗑️ Removed {len(stale_ids)} stale vectors.")
+
+    # Extract in parallel and chunk each file on its own as it arrives, so chunks
+    # never span two documents and no combined corpus string is ever built
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    batch_size = batch_size or config.get("embedding_batch_size", DEFAULT_EMBEDDING_BATCH_SIZE)
+    cache = EmbeddingCache.from_config(config, vectors_model)
+    stage = EmbeddingStage(index, store, batch_size, settings, model, progress, cache,
+                           load_model=lambda: load_model(backend, embedding), store_only=rebuild_reason is not None)
+
+    # Unchanged chunks are copied byte-for-byte; new chunks follow with higher ids
+    chunk_writer = ChunkStoreWriter(out_dir)
+    if old_chunks is not None:
+        live = set(live_chunk_ids(manifest))
+        for chunk_id, data in old_chunks.raw_items():
+            if chunk_id in live:
+                chunk_writer.add(chunk_id, data)
+        old_chunks.close()
+    new_count = 0
+    next_id = manifest["next_id"]
+    progress("extracting", files_done=0, files_total=len(changed))
+
+    for files_done, (key, text) in enumerate(iter_extracted_texts({key: sources[key] for key in changed}, workers), 1):
+        file_chunks = splitter.split_text(text)
+        ids = list(range(next_id, next_id + len(file_chunks)))
+        next_id += len(file_chunks)
+
+        st = os.stat(sources[key])
+        manifest["files"][key] = {
+            "sha256": changed[key],
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "chunk_ids": ids
+        }
+        chunk_writer.add_many(ids, file_chunks)
+        stage.add(ids, file_chunks)
+        new_count += len(file_chunks)
+        progress("extracting", files_done=files_done, files_total=len(changed))
+
+    index = stage.flush()
+    manifest["next_id"] = next_id
+    manifest["dim"] = store.dim
+    print(f"🧩 Split changed files into {new_count} new chunks.")
+    if cache is not None and new_count:
+        print(f"♻️ Embedding cache: {cache.hits} hits, {cache.misses} misses.")
+
+    if not len(chunk_writer):
+        chunk_writer.abort()
+        return 0
+    live_ids = live_chunk_ids(manifest)
+
+    # IVF centroids trained on a small corpus go stale as it grows; retrain from the store
+    if (index is not None and needs_training(settings)
+            and index.ntotal > IVF_RETRAIN_GROWTH * manifest.get("trained_on", 0)
+            and store_covers(store, live_ids)):
+        print(f"🔁 Corpus grew past {IVF_RETRAIN_GROWTH}x the IVF training set — retraining.")
+        index = None
+
+    progress("indexing", chunks_total=len(live_ids))
+    if index is None or rebuild_reason:
+        index, manifest["trained_on"] = index_from_store(store, live_ids, settings)
+    elif len(store) > 2 * len(live_ids):
+        # Deleted rows stay in the append-only vector file until they outnumber live ones
+        store.compact(live_ids)
+        print(f"🧹 Compacted vector store to {len(store)} rows.")
+
+    if index.ntotal != len(live_ids):
+        # Never activate an index that silently lost part of the corpus
+        raise RuntimeError(f"Index has {index.ntotal} vectors but the manifest lists {len(live_ids)} chunks.")
+
+    progress("writing")
+    manifest["index"] = build_params(settings)
+    write_outputs(out_dir, index, chunk_writer, manifest)
+    print(f"✅ Updated {settings['type']} FAISS index: {index.ntotal} vectors, {len(live_ids)} chunks.")
+    return len(live_ids)
+
+
+def build_generation(full=False, workers=None, batch_size=None, model=None, progress=None, backend=None):
+    """Build the next index generation from the live one and make it current.
+
+    Returns the new generation's name, or None if the index was already up to date.
+    The previous generations are kept (up to index_generations_to_keep) for rollback.
+    """
+    source_dir = index_generations.current_index_dir()
+    out_dir = index_generations.new_generation_dir()
+    try:
+        count = build_index(source_dir, out_dir, full, workers, batch_size, model, progress, backend)
+    except BaseException:
+        index_generations.discard_generation(out_dir)
+        raise
+
+    if count == 0 or not os.path.exists(os.path.join(out_dir, INDEX_FILE)):
+        index_generations.discard_generation(out_dir)
+        if count == 0:
+            raise RuntimeError("No valid chunks to embed.")
+        return None
+
+    name = index_generations.finish_generation(out_dir)
+    index_generations.activate(name)
+    index_generations.prune(load_config().get("index_generations_to_keep", DEFAULT_GENERATIONS_TO_KEEP))
+    print(f"🚀 Activated index generation {name}.")
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or incrementally update the RAG vector index.")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the manifest and re-embed every file from scratch")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="extraction processes (default: one per CPU core)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="chunks embedded per batch (default: embedding_batch_size in config.json)")
+    parser.add_argument("--progress-json", action="store_true",
+                        help="also print progress and the new generation as JSON lines (used by the app)")
+    args = parser.parse_args()
+
+    def report(**fields):
+        print(PROGRESS_MARKER + json.dumps(fields), flush=True)
+
+    try:
+        name = build_generation(full=args.full, workers=args.workers, batch_size=args.batch_size,
+                                progress=(lambda stage, **counts: report(stage=stage, progress=counts))
+                                if args.progress_json else None)
+        if args.progress_json:
+            report(generation=name)
+    except RuntimeError as e:
+        print(f"❌ {e} Exiting.")
+        exit(1)
 
-faiss.write_index(index, "vector_index.faiss")
-with open("chunks.pkl", "wb") as f:
-    pickle.dump(chunks, f)
 
-print(f"✅ Rebuilt FAISS index with {len(chunks)} chunks.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import numpy as np
+from lru import LRUCache
+
+
+def normalize_prompt(prompt):
+    """Cache key for a prompt. all-MiniLM-L6-v2 lowercases its input and its tokenizer
+    ignores runs of whitespace, so neither changes the embedding."""
+    return " ".join(prompt.split()).lower()
+
+
+class QueryEmbedder:
+    """Embeds /ask prompts, remembering the most recent ones in a bounded LRU."""
+
+    def __init__(self, encode_fn, max_entries=1024):
+        self.encode_fn = encode_fn
+        self.cache = LRUCache(max_entries)
+
+    def encode(self, prompt):
+        """Return the prompt's embedding as a read-only 1-d float32 vector."""
+        key = normalize_prompt(prompt)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = np.asarray(self.encode_fn([prompt]), dtype=np.float32)[0]
+            vector.setflags(write=False)  # Shared between requests
+            self.cache.put(key, vector)
+        return vector
+
+    def stats(self):
+        return self.cache.stats()
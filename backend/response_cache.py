@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from lru import LRUCache
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(APP_DIR, "response_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_DISK_ENTRIES = 100000
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+# A generation that dies without finishing must not block its key forever
+DEFAULT_IN_PROGRESS_TTL_SECONDS = 300
+
+IN_PROGRESS = "IN_PROGRESS"
+
+# Counting rows is a table scan, so only check the disk size every so many writes
+EVICTION_CHECK_INTERVAL = 500
+
+
+class ResponseCache:
+    """"prompt|model" -> rendered answer cache with a TTL.
+
+    An in-process LRU of finished answers sits in front of a SQLite table (WAL mode)
+    that every request thread and worker process shares. The IN_PROGRESS marker only
+    lives in SQLite, where claim() sets it atomically, so two processes never
+    generate the same answer at once.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_disk_entries=DEFAULT_MAX_DISK_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 in_progress_ttl_seconds=DEFAULT_IN_PROGRESS_TTL_SECONDS):
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.in_progress_ttl_seconds = in_progress_ttl_seconds
+        self.memory = LRUCache(max_entries)  # key -> (answer, expires_at)
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._writes_since_check = 0
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at);
+        """)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the cache from the response_cache section of config.json."""
+        settings = config.get("response_cache", {})
+        return cls(
+            path=settings.get("path", DEFAULT_CACHE_PATH),
+            max_entries=settings.get("max_entries", DEFAULT_MAX_ENTRIES),
+            max_disk_entries=settings.get("max_disk_entries", DEFAULT_MAX_DISK_ENTRIES),
+            ttl_seconds=settings.get("ttl_seconds", DEFAULT_TTL_SECONDS),
+            in_progress_ttl_seconds=settings.get("in_progress_ttl_seconds", DEFAULT_IN_PROGRESS_TTL_SECONDS)
+        )
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """The cached answer, IN_PROGRESS while another request is generating it, or None."""
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry is not None:
+            answer, expires_at = entry
+            if expires_at > now:
+                self.hits += 1
+                return answer
+            self.memory.pop(key)
+
+        row = self._conn().execute(
+            "SELECT answer, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        answer, expires_at = row
+        if answer != IN_PROGRESS:
+            self.hits += 1
+            self.memory.put(key, (answer, expires_at))
+        return answer
+
+    def claim(self, key):
+        """Mark key IN_PROGRESS unless a live entry exists. True if this caller now owns it."""
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO responses (key, answer, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET answer = excluded.answer, expires_at = excluded.expires_at "
+            "WHERE responses.expires_at <= ?",
+            (key, IN_PROGRESS, now + self.in_progress_ttl_seconds, now)
+        )
+        return cursor.rowcount == 1
+
+    def set(self, key, answer, ttl_seconds=None, persist=True):
+        """Store a finished answer. persist=False keeps it in this process's memory only."""
+        expires_at = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        self.memory.put(key, (answer, expires_at))
+        if not persist:
+            return
+        self._conn().execute(
+            "INSERT OR REPLACE INTO responses (key, answer, expires_at) VALUES (?, ?, ?)",
+            (key, answer, expires_at)
+        )
+        self._writes_since_check += 1
+        if self._writes_since_check >= EVICTION_CHECK_INTERVAL:
+            self._writes_since_check = 0
+            self.evict()
+
+    def delete(self, key):
+        self.memory.pop(key)
+        self._conn().execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def evict(self):
+        """Drop expired rows, then the soonest-to-expire ones beyond max_disk_entries."""
+        conn = self._conn()
+        expired = conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+        count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = max(0, count - self.max_disk_entries)
+        if excess:
+            conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY expires_at LIMIT ?)",
+                (excess,)
+            )
+        if expired or excess:
+            print(f"🧹 Evicted {expired + excess} cached responses.")
+        return expired + excess
+
+    def import_json(self, path):
+        """One-off migration of the old whole-file query_cache.json."""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "r") as f:
+                legacy = json.load(f)
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"⚠️ Skipping unreadable {path}: {e}")
+            return 0
+        expires_at = time.time() + self.ttl_seconds
+        rows = [(key, answer, expires_at) for key, answer in legacy.items()
+                if isinstance(answer, str) and answer != IN_PROGRESS]
+        self._conn().executemany(
+            "INSERT OR IGNORE INTO responses (key, answer, expires_at) VALUES (?, ?, ?)", rows
+        )
+        os.replace(path, path + ".migrated")
+        print(f"📦 Migrated {len(rows)} cached responses from {path}.")
+        return len(rows)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory": self.memory.stats()
+        }
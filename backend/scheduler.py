@@ -0,0 +1,259 @@
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+
+from metrics import REGISTRY
+
+INTERACTIVE = 0  # Lower runs first
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+DEFAULT_MAX_CONCURRENT_PER_MODEL = 1  # Ollama's own default is one request per loaded model
+DEFAULT_MAX_QUEUE_PER_MODEL = 16
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_QUEUE_TIMEOUT_SECONDS = 120
+DEFAULT_RETRY_AFTER_SECONDS = 5
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "rag_ollama_queue_wait_seconds", "Time requests waited for an Ollama slot.", ["model", "priority"])
+SHED = REGISTRY.counter(
+    "rag_ollama_shed_total", "Requests turned away by the Ollama scheduler.", ["model", "priority", "reason"])
+
+
+class Overloaded(Exception):
+    """A request the scheduler turned away; answer it with status (429 or 503) and Retry-After."""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Slot:
+    """Permission to run one Ollama request against a model. Release it (or leave its
+    with block) once the response has been fully read."""
+
+    def __init__(self, scheduler, model, priority):
+        self.scheduler = scheduler
+        self.model = model
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.waited = 0.0
+        self.granted = False
+        self.released = False
+        self._event = threading.Event()
+        self._loop = None
+        self._future = None
+
+    def _grant(self):
+        """Called with the scheduler lock held."""
+        self.granted = True
+        self.waited = time.monotonic() - self.queued_at
+        self._event.set()
+        if self._future is not None:
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    def release(self):
+        self.scheduler._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class OllamaScheduler:
+    """Central gate for Ollama calls, with a pooled client.
+
+    Each model runs at most its concurrency limit of requests at once; the rest wait
+    in a per-model priority queue (interactive before background, then first come
+    first served). Requests are shed up front with check() when the model's queue
+    (429) or the whole queue (503) is full, and time out with 503 if they wait longer
+    than queue_timeout_seconds.
+    """
+
+    def __init__(self, host=None, max_concurrent_per_model=DEFAULT_MAX_CONCURRENT_PER_MODEL,
+                 model_concurrency=None, max_queue_per_model=DEFAULT_MAX_QUEUE_PER_MODEL,
+                 max_queue=DEFAULT_MAX_QUEUE, queue_timeout_seconds=DEFAULT_QUEUE_TIMEOUT_SECONDS,
+                 retry_after_seconds=DEFAULT_RETRY_AFTER_SECONDS, pool_connections=None):
+        self.host = host
+        self.max_concurrent_per_model = max_concurrent_per_model
+        self.model_concurrency = model_concurrency or {}
+        self.max_queue_per_model = max_queue_per_model
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout_seconds
+        self.retry_after = retry_after_seconds
+        self.pool_connections = pool_connections or max(max_concurrent_per_model * 4, 8)
+        self._active = {}
+        self._queues = {}
+        self._queued = 0
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.shed = 0
+        self.timeouts = 0
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._async_client = None
+
+    @classmethod
+    def from_config(cls, config):
+        settings = config.get("scheduler", {})
+        return cls(
+            host=settings.get("host"),
+            max_concurrent_per_model=settings.get("max_concurrent_per_model", DEFAULT_MAX_CONCURRENT_PER_MODEL),
+            model_concurrency=settings.get("model_concurrency"),
+            max_queue_per_model=settings.get("max_queue_per_model", DEFAULT_MAX_QUEUE_PER_MODEL),
+            max_queue=settings.get("max_queue", DEFAULT_MAX_QUEUE),
+            queue_timeout_seconds=settings.get("queue_timeout_seconds", DEFAULT_QUEUE_TIMEOUT_SECONDS),
+            retry_after_seconds=settings.get("retry_after_seconds", DEFAULT_RETRY_AFTER_SECONDS),
+            pool_connections=settings.get("pool_connections")
+        )
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(max_connections=self.pool_connections, max_keepalive_connections=self.pool_connections)
+
+    @property
+    def client(self):
+        """Keep-alive connections shared by every request, instead of the module-level client.
+        Created (and ollama imported) on first use."""
+        with self._client_lock:
+            if self._client is None:
+                import ollama
+                self._client = ollama.Client(self.host, limits=self._limits())
+        return self._client
+
+    def async_client(self):
+        """The pooled AsyncClient, created on first use from the event loop that will use it."""
+        if self._async_client is None:
+            import ollama
+            self._async_client = ollama.AsyncClient(self.host, limits=self._limits())
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+    def limit(self, model):
+        return self.model_concurrency.get(model, self.max_concurrent_per_model)
+
+    def active(self, model):
+        """Requests for model currently holding a slot."""
+        return self._active.get(model, 0)
+
+    def check(self, model, priority=INTERACTIVE):
+        """Raise Overloaded if a new request for model should be turned away right now."""
+        with self._lock:
+            queued = len(self._queues.get(model, ()))
+            if queued >= self.max_queue_per_model:
+                reason, status = "model_queue_full", 429
+            elif self._queued >= self.max_queue:
+                reason, status = "queue_full", 503
+            else:
+                return
+            self.shed += 1
+        SHED.inc(model=model, priority=PRIORITY_NAMES[priority], reason=reason)
+        if status == 429:
+            raise Overloaded(f"Too many requests queued for {model}; try again shortly.", status, self.retry_after)
+        raise Overloaded("The model server is overloaded; try again shortly.", status, self.retry_after)
+
+    def _enqueue(self, model, priority):
+        slot = Slot(self, model, priority)
+        with self._lock:
+            queue = self._queues.setdefault(model, [])
+            if not queue and self._active.get(model, 0) < self.limit(model):
+                self._active[model] = self._active.get(model, 0) + 1
+                self.granted += 1
+                slot._grant()
+            else:
+                heapq.heappush(queue, (priority, next(self._order), slot))
+                self._queued += 1
+        return slot
+
+    def acquire(self, model, priority=INTERACTIVE):
+        """Block until a slot for model is free and return it."""
+        slot = self._enqueue(model, priority)
+        if not slot._event.wait(self.queue_timeout) and self._withdraw(slot):
+            self._timed_out(slot)
+        self._observe(slot)
+        return slot
+
+    async def acquire_async(self, model, priority=INTERACTIVE):
+        """acquire() for asyncio: waiting holds no thread."""
+        slot = self._enqueue(model, priority)
+        with self._lock:
+            if not slot.granted:
+                slot._loop = asyncio.get_running_loop()
+                slot._future = slot._loop.create_future()
+        if slot._future is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(slot._future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if self._withdraw(slot):
+                    self._timed_out(slot)
+            except asyncio.CancelledError:
+                if not self._withdraw(slot):
+                    slot.release()  # Granted just as we were cancelled
+                raise
+        self._observe(slot)
+        return slot
+
+    def _withdraw(self, slot):
+        """Take a waiting slot out of its queue. False if it was granted meanwhile."""
+        with self._lock:
+            if slot.granted:
+                return False
+            queue = self._queues[slot.model]
+            queue[:] = [entry for entry in queue if entry[2] is not slot]
+            heapq.heapify(queue)
+            self._queued -= 1
+            return True
+
+    def _timed_out(self, slot):
+        self.timeouts += 1
+        SHED.inc(model=slot.model, priority=PRIORITY_NAMES[slot.priority], reason="timeout")
+        raise Overloaded(f"Timed out after {self.queue_timeout}s waiting for {slot.model}.", 503, self.retry_after)
+
+    def _observe(self, slot):
+        QUEUE_WAIT_SECONDS.observe(slot.waited, model=slot.model, priority=PRIORITY_NAMES[slot.priority])
+
+    def _release(self, slot):
+        with self._lock:
+            if slot.released:
+                return
+            slot.released = True
+            self._active[slot.model] -= 1
+            queue = self._queues.get(slot.model)
+            while queue and self._active[slot.model] < self.limit(slot.model):
+                _, _, waiting = heapq.heappop(queue)
+                self._queued -= 1
+                self._active[slot.model] += 1
+                self.granted += 1
+                waiting._grant()
+
+    def stats(self):
+        with self._lock:
+            models = {
+                model: {
+                    "active": self._active.get(model, 0),
+                    "queued": len(self._queues.get(model, ())),
+                    "limit": self.limit(model)
+                }
+                for model in set(self._active) | set(self._queues)
+            }
+            return {
+                "models": models,
+                "queued": self._queued,
+                "granted": self.granted,
+                "shed": self.shed,
+                "timeouts": self.timeouts
+            }
@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_MAX_ENTRIES = 1000
+# Neighbours searched per lookup, so entries from older generations can't hide a current one
+LOOKUP_NEIGHBOURS = 8
+# Upper edges of the best-similarity histogram, for tuning the threshold
+SIMILARITY_BUCKETS = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0]
+
+
+class SemanticCache:
+    """Finds an earlier prompt whose embedding is close enough to reuse its answer.
+
+    Keeps one small exact inner-product FAISS index of normalized prompt vectors per
+    model, mapping to the exact response-cache key. Entries are tagged with the vector
+    index generation they were answered from and never match under another one.
+    The oldest entries beyond max_entries per model are dropped.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        self.hit_similarity_total = 0.0
+        self.histogram = [0] * len(SIMILARITY_BUCKETS)
+        self._models = {}  # model -> (index, OrderedDict id -> (key, generation))
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the cache from the semantic_cache section of config.json, or None if disabled."""
+        settings = config.get("semantic_cache", {})
+        if not settings.get("enabled", False):
+            return None
+        return cls(
+            threshold=settings.get("threshold", DEFAULT_THRESHOLD),
+            max_entries=settings.get("max_entries", DEFAULT_MAX_ENTRIES)
+        )
+
+    @staticmethod
+    def _normalized(vector):
+        import faiss
+        vector = np.array(vector, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _record(self, similarity):
+        for bucket, edge in enumerate(SIMILARITY_BUCKETS):
+            if similarity <= edge:
+                self.histogram[bucket] += 1
+                return
+        self.histogram[-1] += 1
+
+    def lookup(self, model, vector, generation):
+        """Return (key, similarity) of the closest cached prompt of this generation above
+        the threshold, or None. Entries of other generations found on the way are dropped."""
+        with self._lock:
+            index, entries = self._models.get(model, (None, None))
+            if not entries:
+                self.misses += 1
+                return None
+            similarities, ids = index.search(self._normalized(vector), min(LOOKUP_NEIGHBOURS, len(entries)))
+            best = None
+            for similarity, entry_id in zip(similarities[0].tolist(), ids[0].tolist()):
+                entry = entries.get(entry_id)
+                if entry is None:
+                    continue
+                if entry[1] != generation:
+                    self._remove(model, entry_id)
+                elif best is None:
+                    best = (entry[0], similarity)
+            if best is None:
+                self.misses += 1
+                return None
+            key, similarity = best
+            self._record(similarity)
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.hit_similarity_total += similarity
+            return key, similarity
+
+    def add(self, model, vector, key, generation):
+        import faiss  # Deferred like the vector index, so importing app doesn't load it
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = (faiss.IndexIDMap(faiss.IndexFlatIP(len(vector))), OrderedDict())
+            index, entries = self._models[model]
+            entry_id = self._next_id
+            self._next_id += 1
+            index.add_with_ids(self._normalized(vector), np.array([entry_id], dtype=np.int64))
+            entries[entry_id] = (key, generation)
+            while len(entries) > self.max_entries:
+                self._remove(model, next(iter(entries)))
+
+    def discard(self, model, key):
+        """Forget every entry pointing at key, e.g. once its answer has expired."""
+        with self._lock:
+            _, entries = self._models.get(model, (None, {}))
+            for entry_id in [i for i, (k, _) in entries.items() if k == key]:
+                self._remove(model, entry_id)
+
+    def _remove(self, model, entry_id):
+        index, entries = self._models[model]
+        index.remove_ids(np.array([entry_id], dtype=np.int64))
+        del entries[entry_id]
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(len(entries) for _, entries in self._models.values()),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "mean_hit_similarity": round(self.hit_similarity_total / self.hits, 4) if self.hits else None,
+            "best_similarity_histogram": dict(zip((str(edge) for edge in SIMILARITY_BUCKETS), self.histogram))
+        }
@@ -0,0 +1,150 @@
+import time
+import asyncio
+import threading
+
+
+class Flight:
+    """Token stream of one in-flight generation, fanned out to any number of subscribers.
+
+    Every published token is kept until the flight finishes, so a subscriber that
+    joins late first gets everything sent so far, then follows along live.
+    """
+
+    def __init__(self):
+        self.subscribers = 0
+        self.error = None
+        self.summary = None  # Set by the producer on success, e.g. timings and token counts
+        self._tokens = []
+        self._chars = 0
+        self._done = False
+        self._cond = threading.Condition()
+        self._waiters = set()  # (loop, asyncio.Event) of subscribe_async() callers
+
+    def publish(self, token):
+        with self._cond:
+            self._tokens.append(token)
+            self._chars += len(token)
+            self._cond.notify_all()
+            self._wake_async()
+
+    def finish(self, error=None, summary=None):
+        with self._cond:
+            self._done = True
+            self.error = error
+            self.summary = summary
+            self._cond.notify_all()
+            self._wake_async()
+
+    def _wake_async(self):
+        # Producers may be threads, so wake event loops thread-safely (skipping already woken ones)
+        for loop, wakeup in self._waiters:
+            if not wakeup.is_set():
+                try:
+                    loop.call_soon_threadsafe(wakeup.set)
+                except RuntimeError:
+                    pass  # Loop closed
+
+    def subscribe(self, flush_chars=0, flush_interval=0.0):
+        """Yield the stream from its first token, as joined chunks.
+
+        After the first token, a chunk is flushed once flush_chars characters are
+        pending or flush_interval seconds have passed since the previous flush,
+        whichever comes first, so fast generations cost far fewer writes than tokens.
+        Check error once the generator is exhausted.
+        """
+        with self._cond:
+            self.subscribers += 1
+        sent = sent_chars = 0
+        last_flush = float("-inf")  # The first token goes out at once
+        while True:
+            with self._cond:
+                while not self._done:
+                    pending = self._chars - sent_chars
+                    waited = time.monotonic() - last_flush
+                    if pending and (pending >= flush_chars or waited >= flush_interval):
+                        break
+                    self._cond.wait(flush_interval - waited if pending else None)
+                pending = self._tokens[sent:]
+                done = self._done
+            if pending:
+                chunk = "".join(pending)
+                sent += len(pending)
+                sent_chars += len(chunk)
+                last_flush = time.monotonic()
+                yield chunk
+            if done:
+                return
+
+    async def subscribe_async(self, flush_chars=0, flush_interval=0.0):
+        """subscribe() for asyncio: the same chunks, but waiting costs no thread."""
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        waiter = (loop, wakeup)
+        with self._cond:
+            self.subscribers += 1
+            self._waiters.add(waiter)
+        try:
+            sent = sent_chars = 0
+            last_flush = float("-inf")
+            while True:
+                with self._cond:
+                    pending_chars = self._chars - sent_chars
+                    waited = loop.time() - last_flush
+                    done = self._done
+                    ready = done or (pending_chars and (pending_chars >= flush_chars or waited >= flush_interval))
+                    if ready:
+                        pending = self._tokens[sent:]
+                    else:
+                        wakeup.clear()  # Under the lock, so no publish() is missed
+                if not ready:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), flush_interval - waited if pending_chars else None)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if pending:
+                    chunk = "".join(pending)
+                    sent += len(pending)
+                    sent_chars += len(chunk)
+                    last_flush = loop.time()
+                    yield chunk
+                if done:
+                    return
+        finally:
+            with self._cond:
+                self._waiters.discard(waiter)
+
+
+class SingleFlight:
+    """At most one generation per key at a time; identical requests share its Flight."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.joined = 0
+
+    def join(self, key):
+        """Return (flight, leader). Only the leader should start the generation."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.joined += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.started += 1
+            return flight, True
+
+    def finish(self, key, flight, error=None, summary=None):
+        """End the flight and let the next request for key start a new one."""
+        flight.finish(error, summary)
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self):
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "joined": self.joined
+        }
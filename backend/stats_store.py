@@ -0,0 +1,301 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STATS_PATH = os.path.join(APP_DIR, "stats.sqlite")
+
+# Column name -> SQLite type. Every field of a stat record that gets stored.
+STAT_COLUMNS = {
+    "question": "TEXT NOT NULL",
+    "model": "TEXT NOT NULL",
+    "source": "TEXT",
+    "timestamp": "TEXT NOT NULL",
+    "response_time_ms": "REAL",
+    "ttft_ms": "REAL",
+    "extraction_ms": "REAL",
+    "splitting_ms": "REAL",
+    "embedding_ms": "REAL",
+    "retrieval_ms": "REAL",
+    "search_ms": "REAL",
+    "lexical_ms": "REAL",
+    "assembly_ms": "REAL",
+    "queue_ms": "REAL",
+    "context_tokens": "INTEGER",
+    "context_tokens_saved": "INTEGER",
+    "prompt_eval_count": "INTEGER",
+    "eval_count": "INTEGER",
+    "prompt_eval_duration_ms": "REAL",
+    "eval_duration_ms": "REAL",
+    "load_duration_ms": "REAL",
+    "tokens_per_second": "REAL"
+}
+
+# Latencies histogrammed per rollup group, and the log-spaced bins they fall in:
+# bin b holds values in [HISTOGRAM_BASE**b, HISTOGRAM_BASE**(b+1)) ms, i.e. ~5% resolution
+HISTOGRAM_METRICS = ("response_time_ms", "ttft_ms")
+HISTOGRAM_BASE = 1.05
+PERCENTILES = (50, 90, 99)
+GROUP_FIELDS = ("model", "source")
+BUCKET_FORMATS = {"hour": 13, "day": 10, "month": 7}  # Prefix length of the ISO timestamp
+
+
+def histogram_bin(ms):
+    return int(math.log(ms, HISTOGRAM_BASE)) if ms >= 1 else 0
+
+def bin_value(b):
+    """Geometric midpoint of a bin, the value reported for percentiles falling in it."""
+    return HISTOGRAM_BASE ** (b + 0.5) if b else 0.5
+
+def percentiles(bins):
+    """{"p50": ms, ...} from a {bin: count} histogram."""
+    total = sum(bins.values())
+    if not total:
+        return {f"p{p}": None for p in PERCENTILES}
+    result = {}
+    ordered = sorted(bins.items())
+    for p in PERCENTILES:
+        rank = math.ceil(total * p / 100)
+        seen = 0
+        for b, count in ordered:
+            seen += count
+            if seen >= rank:
+                result[f"p{p}"] = round(bin_value(b), 1)
+                break
+    return result
+
+
+class StageTimer:
+    """Wall-clock milliseconds per pipeline stage of one request, plus time since it started.
+
+    observer(stage, seconds), if given, is told about every timed stage as it ends.
+    """
+
+    def __init__(self, observer=None):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.observer = observer
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+            if self.observer is not None:
+                self.observer(name, seconds)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def record(self):
+        """Stage timings as stat fields, e.g. {"embedding_ms": 12.3}."""
+        return {f"{name}_ms": round(ms, 2) for name, ms in self.stages.items()}
+
+
+def ollama_metrics(response):
+    """Token counts and durations from Ollama's final (done) chunk or non-streaming response."""
+    eval_count = response.get("eval_count")
+    eval_duration = response.get("eval_duration")  # Nanoseconds
+    metrics = {
+        "prompt_eval_count": response.get("prompt_eval_count"),
+        "eval_count": eval_count,
+        "tokens_per_second": round(eval_count / (eval_duration / 1e9), 2) if eval_count and eval_duration else None
+    }
+    for field in ("prompt_eval_duration", "eval_duration", "load_duration"):
+        if response.get(field) is not None:
+            metrics[f"{field}_ms"] = round(response.get(field) / 1e6, 2)
+    return metrics
+
+
+class StatsStore:
+    """Append-only request stats in SQLite (WAL mode, safe across threads and processes).
+
+    A unique index on (question, model) keeps the first record of each combination,
+    so de-duplication no longer means scanning every row.
+
+    Each append also bumps per (model, source, hour) counters and latency histograms
+    in the same transaction, so summary() reads those instead of the raw rows.
+    """
+
+    def __init__(self, path=DEFAULT_STATS_PATH):
+        self.path = path
+        self._local = threading.local()
+        columns = ",\n".join(f"{name} {kind}" for name, kind in STAT_COLUMNS.items())
+        self._conn().executescript(f"""
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY,
+                {columns}
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS stats_question_model ON stats (question, model);
+            CREATE TABLE IF NOT EXISTS stats_rollup (
+                model TEXT NOT NULL,
+                source TEXT NOT NULL,
+                hour TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                eval_count INTEGER NOT NULL,
+                eval_seconds REAL NOT NULL,
+                PRIMARY KEY (model, source, hour)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats_histogram (
+                model TEXT NOT NULL,
+                source TEXT NOT NULL,
+                hour TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                bin INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (model, source, hour, metric, bin)
+            ) WITHOUT ROWID;
+        """)
+        self._add_missing_columns()
+        self._backfill_rollups()
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def add(self, record):
+        """Append a record. False if one for the same question and model already exists."""
+        names = [name for name in STAT_COLUMNS if record.get(name) is not None]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                f"INSERT OR IGNORE INTO stats ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                [record[name] for name in names]
+            )
+            added = cursor.rowcount == 1
+            if added:
+                self._roll_up(conn, record)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def _roll_up(self, conn, record):
+        group = (record["model"], record.get("source") or "Unknown", record["timestamp"][:BUCKET_FORMATS["hour"]])
+        # Only records with both parts count towards tokens/s
+        timed = record.get("eval_count") and record.get("eval_duration_ms")
+        eval_count = record["eval_count"] if timed else 0
+        eval_seconds = record["eval_duration_ms"] / 1000 if timed else 0.0
+        conn.execute(
+            "INSERT INTO stats_rollup (model, source, hour, count, eval_count, eval_seconds) VALUES (?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT (model, source, hour) DO UPDATE SET count = count + 1, "
+            "eval_count = eval_count + excluded.eval_count, eval_seconds = eval_seconds + excluded.eval_seconds",
+            (*group, eval_count, eval_seconds)
+        )
+        for metric in HISTOGRAM_METRICS:
+            if record.get(metric) is not None:
+                conn.execute(
+                    "INSERT INTO stats_histogram (model, source, hour, metric, bin, count) VALUES (?, ?, ?, ?, ?, 1) "
+                    "ON CONFLICT (model, source, hour, metric, bin) DO UPDATE SET count = count + 1",
+                    (*group, metric, histogram_bin(record[metric]))
+                )
+
+    def _add_missing_columns(self):
+        """Bring a stats table created by an older version up to STAT_COLUMNS."""
+        conn = self._conn()
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(stats)")}
+        for name, kind in STAT_COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE stats ADD COLUMN {name} {kind.replace(' NOT NULL', '')}")
+
+    def _backfill_rollups(self):
+        """Roll up rows stored before the rollup tables existed."""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM stats_rollup LIMIT 1").fetchone() or \
+                not conn.execute("SELECT 1 FROM stats LIMIT 1").fetchone():
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        for row in conn.execute("SELECT * FROM stats").fetchall():
+            self._roll_up(conn, dict(row))
+        conn.execute("COMMIT")
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM stats").fetchone()[0]
+
+    def rows(self, limit=None, offset=0, newest_first=False):
+        """Records oldest first (or newest first), without empty fields."""
+        rows = self._conn().execute(
+            f"SELECT * FROM stats ORDER BY id {'DESC' if newest_first else 'ASC'} LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset)
+        ).fetchall()
+        return [{key: row[key] for key in row.keys() if key != "id" and row[key] is not None} for row in rows]
+
+    def summary(self, group_by=GROUP_FIELDS, bucket=None, since=None, until=None):
+        """Request counts, latency percentiles and tokens/s per group.
+
+        group_by is any of "model" and "source"; bucket ("hour", "day", "month" or None)
+        adds a time-bucket dimension. since/until are ISO timestamp prefixes
+        (e.g. "2025-06-01") matched against the hour bucket. Both are inclusive of the
+        whole period they name: until="2025-06" covers all of June.
+        """
+        fields = [field for field in GROUP_FIELDS if field in group_by]
+        conditions, params = [], []
+        if since:
+            conditions.append("hour >= ?")
+            params.append(since[:BUCKET_FORMATS["hour"]])
+        if until:
+            # Compared at until's own precision, so "2025-06-30" includes that day's last hour
+            until = until[:BUCKET_FORMATS["hour"]]
+            conditions.append("substr(hour, 1, ?) <= ?")
+            params.extend([len(until), until])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        def group_of(row):
+            group = {field: row[field] for field in fields}
+            if bucket:
+                group["bucket"] = row["hour"][:BUCKET_FORMATS[bucket]]
+            return tuple(group.items())
+
+        conn = self._conn()
+        groups = {}
+        for row in conn.execute(f"SELECT * FROM stats_rollup {where}", params):
+            totals = groups.setdefault(group_of(row), {"count": 0, "eval_count": 0, "eval_seconds": 0.0,
+                                                      "bins": {metric: {} for metric in HISTOGRAM_METRICS}})
+            totals["count"] += row["count"]
+            totals["eval_count"] += row["eval_count"]
+            totals["eval_seconds"] += row["eval_seconds"]
+        for row in conn.execute(f"SELECT * FROM stats_histogram {where}", params):
+            bins = groups[group_of(row)]["bins"][row["metric"]]
+            bins[row["bin"]] = bins.get(row["bin"], 0) + row["count"]
+
+        summary = []
+        for group, totals in sorted(groups.items()):
+            entry = dict(group)
+            entry["count"] = totals["count"]
+            entry["tokens_per_second"] = round(totals["eval_count"] / totals["eval_seconds"], 2) \
+                if totals["eval_seconds"] else None
+            for metric in HISTOGRAM_METRICS:
+                entry[metric] = percentiles(totals["bins"][metric])
+            summary.append(entry)
+        return summary
+
+    def import_json(self, path):
+        """One-off migration of the old whole-file stats.json."""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "r") as f:
+                legacy = json.load(f)
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"⚠️ Skipping unreadable {path}: {e}")
+            return 0
+        added = sum(self.add(record) for record in legacy if record.get("question") and record.get("model"))
+        os.replace(path, path + ".migrated")
+        print(f"📦 Migrated {added} stats from {path}.")
+        return added
@@ -0,0 +1,71 @@
+import json
+import asyncio
+
+DEFAULT_FLUSH_CHARS = 256
+DEFAULT_FLUSH_INTERVAL_MS = 25
+
+# Stop reverse proxies (nginx) from buffering the stream
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Set in the WSGI environ by asgi.py: streaming views then return a Response with an
+# async_body(client) attribute, iterated on the event loop, instead of a sync body
+ASYNC_STREAM_KEY = "rag.async_stream"
+
+_background_tasks = set()
+
+
+def flush_settings(config):
+    """subscribe() keyword arguments from the streaming section of config.json."""
+    settings = config.get("streaming", {})
+    return {
+        "flush_chars": settings.get("flush_chars", DEFAULT_FLUSH_CHARS),
+        "flush_interval": settings.get("flush_interval_ms", DEFAULT_FLUSH_INTERVAL_MS) / 1000
+    }
+
+def wants_sse(request):
+    return request.args.get("format") == "sse" or "text/event-stream" in request.headers.get("Accept", "")
+
+
+def text_stream(flight, **flush):
+    """Plain-text framing: raw chunks, with an error line appended if generation failed."""
+    yield from flight.subscribe(**flush)
+    if flight.error:
+        yield f"\n[Error: {flight.error}]"
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def sse_stream(flight, **flush):
+    """Server-Sent Events framing: one {"token": ...} event per flushed chunk, then a
+    final "stats" event with the generation summary (or an "error" event)."""
+    for chunk in flight.subscribe(**flush):
+        yield sse_event({"token": chunk})
+    if flight.error:
+        yield sse_event({"error": flight.error}, event="error")
+    else:
+        yield sse_event(flight.summary or {}, event="stats")
+
+
+async def text_stream_async(flight, **flush):
+    async for chunk in flight.subscribe_async(**flush):
+        yield chunk
+    if flight.error:
+        yield f"\n[Error: {flight.error}]"
+
+async def sse_stream_async(flight, **flush):
+    async for chunk in flight.subscribe_async(**flush):
+        yield sse_event({"token": chunk})
+    if flight.error:
+        yield sse_event({"error": flight.error}, event="error")
+    else:
+        yield sse_event(flight.summary or {}, event="stats")
+
+
+def run_in_background(coroutine):
+    """Schedule a coroutine that must outlive the request that started it (e.g. a generation
+    other clients are following), holding a reference so it is not garbage collected."""
+    task = asyncio.ensure_future(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
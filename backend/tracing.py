@@ -0,0 +1,202 @@
+import os
+import re
+import json
+import time
+import uuid
+import random
+import pstats
+import logging
+import cProfile
+import threading
+from contextlib import contextmanager
+from stats_store import StageTimer
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LOG_LEVEL = "WARNING"  # Request-path logging is debug/info, so silent by default
+DEFAULT_SLOW_REQUEST_MS = 5000
+DEFAULT_PROFILE_DIR = os.path.join(APP_DIR, "profiles")
+PROFILE_HEADER = "X-Profile"
+
+log = logging.getLogger("rag")
+# Python 3.12+ allows one active cProfile per process (sys.monitoring), so profiled blocks take turns
+_profiler_lock = threading.Lock()
+_profiler_owner = None  # (trace, thread id) of the block holding _profiler_lock
+# How long a block waits for another block of its own trace (e.g. /ask handing off to its
+# generation thread) to release the profiler, before running unprofiled
+PROFILE_HANDOFF_SECONDS = 5
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = "-"
+        return True
+
+
+def configure_logging(config):
+    """Set up the "rag" logger from the tracing section of config.json (RAG_LOG_LEVEL overrides)."""
+    settings = config.get("tracing", {})
+    level = os.environ.get("RAG_LOG_LEVEL") or settings.get("log_level", DEFAULT_LOG_LEVEL)
+    if not log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(message)s"))
+        handler.addFilter(_RequestIdFilter())
+        log.addHandler(handler)
+        log.propagate = False
+    log.setLevel(level.upper())
+
+
+def request_id_from(headers):
+    """The caller's X-Request-ID if it looks sane, otherwise a fresh one."""
+    request_id = re.sub(r"[^A-Za-z0-9._-]", "", headers.get("X-Request-ID", ""))[:64]
+    return request_id or uuid.uuid4().hex[:16]
+
+
+class Trace(StageTimer):
+    """Spans of one request, tagged with its request ID.
+
+    Stages timed with stage() double as spans. finish() logs the whole trace as one
+    JSON line: at info level, or at warning level once it exceeds slow_request_ms.
+    A profiled trace also runs cProfile in every block wrapped in profiled(), on
+    whichever thread, and the merged profile is dumped once the trace is finished
+    and the last of those blocks has exited. Only one block in the process is
+    profiled at a time. A block waits for its own trace's other blocks (so /ask's
+    generation thread is profiled once ask() returns), but runs unprofiled while
+    another trace holds the profiler.
+    """
+
+    def __init__(self, name, request_id=None, observer=None, settings=None, profile=False):
+        super().__init__(observer)
+        settings = settings or {}
+        self.name = name
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.log = logging.LoggerAdapter(log, {"request_id": self.request_id})
+        self.attributes = {}
+        self.spans = []
+        self.slow_request_ms = settings.get("slow_request_ms", DEFAULT_SLOW_REQUEST_MS)
+        self.profile_dir = settings.get("profile_dir", DEFAULT_PROFILE_DIR)
+        self.profile = profile
+        self._forced_profile = profile == "forced"
+        self._profiles = []
+        self._open_profiles = 0
+        self._lock = threading.Lock()
+        self._finished = False
+        self._dump = False
+        self.handed_off = False
+
+    def hand_off(self):
+        """Another thread (e.g. a background generation) will call finish()."""
+        self.handed_off = True
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            with super().stage(name):
+                yield
+        finally:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self.started) * 1000, 2),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2)
+            })
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @contextmanager
+    def profiled(self):
+        if not self.profile:
+            yield
+            return
+        if not self._acquire_profiler():
+            self.log.debug("🔬 Another request is being profiled; skipping this block.")
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:  # A profiler outside this module is active
+            self._release_profiler()
+            self.log.debug(f"🔬 Not profiling: {e}")
+            yield
+            return
+        with self._lock:
+            self._open_profiles += 1
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._release_profiler()
+            with self._lock:
+                self._profiles.append(profiler)
+                self._open_profiles -= 1
+                dump = self._dump and not self._open_profiles
+            if dump:
+                self._dump_profile()
+
+    def _acquire_profiler(self):
+        """Take the process-wide profiler. Blocks of other traces give up at once; a block
+        of this trace on another thread waits for the one it was handed off from."""
+        global _profiler_owner
+        if not _profiler_lock.acquire(blocking=False):
+            owner = _profiler_owner
+            if owner is None or owner[0] is not self or owner[1] == threading.get_ident():
+                return False
+            if not _profiler_lock.acquire(timeout=PROFILE_HANDOFF_SECONDS):
+                return False
+        _profiler_owner = (self, threading.get_ident())
+        return True
+
+    def _release_profiler(self):
+        global _profiler_owner
+        _profiler_owner = None
+        _profiler_lock.release()
+
+    def finish(self, **attributes):
+        """Log the trace (once) and dump its profile if it was forced or the request was slow."""
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        self.attributes.update(attributes)
+        duration_ms = self.elapsed_ms()
+        slow = duration_ms >= self.slow_request_ms
+        level = logging.WARNING if slow else logging.INFO
+        if log.isEnabledFor(level):
+            self.log.log(level, json.dumps({
+                "trace": self.name,
+                "request_id": self.request_id,
+                "duration_ms": round(duration_ms, 2),
+                "spans": self.spans,
+                **self.attributes
+            }, default=str))
+        if self.profile and (self._forced_profile or slow):
+            with self._lock:
+                self._dump = True
+                dump = not self._open_profiles
+            if dump:
+                self._dump_profile()
+
+    def _dump_profile(self):
+        if not self._profiles:
+            return  # Every block ran while another request was being profiled
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{self.name}-{self.request_id}.prof")
+        stats = pstats.Stats(self._profiles[0])
+        for profiler in self._profiles[1:]:
+            stats.add(profiler)
+        stats.dump_stats(path)
+        self.log.warning(f"🔬 Profile written to {path} (inspect with: python -m pstats {path})")
+
+
+def start_trace(name, headers, settings, observer=None):
+    """Trace for a request. It is profiled if profiling is enabled in config and either
+    the request carries X-Profile: 1 (always dumped) or it is sampled (dumped when slow)."""
+    profile = False
+    if settings.get("profiling", False):
+        if headers.get(PROFILE_HEADER) == "1":
+            profile = "forced"
+        elif random.random() < settings.get("profile_sample_rate", 0.0):
+            profile = True
+    return Trace(name, request_id_from(headers), observer, settings, profile)
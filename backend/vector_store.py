@@ -0,0 +1,71 @@
+import os
+import numpy as np
+
+
+class VectorStore:
+    """Append-only float32 embedding file plus a parallel int64 id file, read back via np.memmap."""
+
+    def __init__(self, directory, dim=None, prefix="vectors"):
+        self.vectors_path = os.path.join(directory, f"{prefix}.f32")
+        self.ids_path = os.path.join(directory, f"{prefix}.ids")
+        self.dim = dim
+
+    def __len__(self):
+        if not os.path.exists(self.ids_path) or not self.dim:
+            return 0
+        # A crash between the two appends can leave one file longer; trust the shorter one
+        rows_by_ids = os.path.getsize(self.ids_path) // 8
+        rows_by_vectors = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        return min(rows_by_ids, rows_by_vectors)
+
+    def reset(self):
+        for path in (self.vectors_path, self.ids_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def append(self, ids, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        if vectors.ndim != 2 or vectors.shape[0] != ids.shape[0] or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected ({ids.shape[0]}, {self.dim}) vectors, got {vectors.shape}")
+
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self.ids_path, "ab") as f:
+            f.write(ids.tobytes())
+
+    def open(self):
+        """Return (ids, vectors) as read-only memmaps; nothing is loaded until sliced."""
+        rows = len(self)
+        if rows == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dim or 0), dtype=np.float32)
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(rows,))
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return ids, vectors
+
+    def iter_batches(self, batch_size, live_ids=None):
+        """Yield (ids, vectors) blocks, optionally keeping only rows whose id is in live_ids."""
+        ids, vectors = self.open()
+        live = None if live_ids is None else np.fromiter(live_ids, dtype=np.int64)
+        for start in range(0, len(ids), batch_size):
+            batch_ids = np.asarray(ids[start:start + batch_size])
+            batch_vectors = np.asarray(vectors[start:start + batch_size])
+            if live is not None:
+                keep = np.isin(batch_ids, live)
+                batch_ids, batch_vectors = batch_ids[keep], batch_vectors[keep]
+            if len(batch_ids):
+                yield batch_ids, batch_vectors
+
+    def compact(self, live_ids, batch_size=65536):
+        """Rewrite the store without rows for deleted ids."""
+        tmp = VectorStore(os.path.dirname(self.vectors_path), self.dim,
+                          prefix=os.path.basename(self.vectors_path)[:-len(".f32")] + ".compact")
+        tmp.reset()
+        for batch_ids, batch_vectors in self.iter_batches(batch_size, live_ids):
+            tmp.append(batch_ids, batch_vectors)
+        # An empty result never creates the temp files
+        for src, dst in ((tmp.vectors_path, self.vectors_path), (tmp.ids_path, self.ids_path)):
+            if os.path.exists(src):
+                os.replace(src, dst)
+            elif os.path.exists(dst):
+                os.remove(dst)
@@ -15,11 +15,10 @@ export default function StatsPage() {
   const [stats, setStats] = useState<StatEntry[]>([]);
 
   useEffect(() => {
-    fetch(`${process.env.NEXT_PUBLIC_BACKEND_URL}/list-stats`)
+    fetch(`${process.env.NEXT_PUBLIC_BACKEND_URL}/list-stats?limit=20`)
       .then((res) => res.json())
       .then((data) => {
-        const last20 = data.slice(-20).reverse();
-        setStats(last20);
+        setStats(data.rows);
       })
       .catch((err) => console.error("Failed to fetch stats", err));
   }, []);
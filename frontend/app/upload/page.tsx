@@ -95,7 +95,7 @@ export default function UploadPage() {
               try {
                 const res = await fetch(baseUrl + "/rebuild-index", { method: "POST" });
                 if (res.ok) {
-                  alert("✅ Index rebuilt successfully.");
+                  alert("🔄 Index rebuild started in the background.");
                 } else {
                   alert("⚠️ Failed to rebuild index.");
                 }